@@ -0,0 +1,4 @@
+from .consumer import *
+from .events import *
+from .lag import *
+from .sources import *
@@ -0,0 +1,376 @@
+import asyncio
+import json
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any
+
+from elasticsearch import ApiError, AsyncElasticsearch, TransportError
+from loguru import logger
+
+from app.core.custom_logging import make_customize_logger
+from app.core.es_connection import async_es_connection
+from app.core.settings import settings
+from app.es_models.index_settings import apply_profile, IndexProfile
+from app.es_models.item import INDEX_NAME
+
+from .events import ChangeEvent
+from .lag import cdc_lag
+from .sources import create_event_source, EventSource
+
+__all__ = ["ApplyStats", "BulkApplyWorker"]
+
+# Per item statuses of a bulk response that are worth retrying
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+@dataclass
+class ApplyStats:
+    events: int = 0
+    batches: int = 0
+    indexed: int = 0
+    deleted: int = 0
+    # Older than the indexed document, already applied
+    conflicts: int = 0
+    # Rejected by Elasticsearch, e.g. a mapping error, and skipped
+    failed: int = 0
+    # Older than `min_lsn`, not sent
+    skipped: int = 0
+    retries: int = 0
+
+
+@dataclass
+class _Batch:
+    seq: int
+    # `(action, document)` pairs, the document is `None` for deletes
+    actions: list[tuple[dict[str, Any], dict[str, Any] | None]]
+    # Last event of each partition, committed once the batch is applied
+    last_events: dict[tuple[str, int], ChangeEvent] = field(default_factory=dict)
+    # Reads of a Debezium snapshot
+    snapshot: bool = False
+    done: bool = False
+
+
+class BulkApplyWorker:
+    def __init__(
+        self,
+        source: EventSource,
+        *,
+        index_name: str = INDEX_NAME,
+        max_actions: int = settings.CDC.APPLY_MAX_ACTIONS,
+        max_bytes: int = settings.CDC.APPLY_MAX_BYTES,
+        max_interval: float = settings.CDC.APPLY_MAX_INTERVAL,
+        max_in_flight: int = settings.CDC.APPLY_MAX_IN_FLIGHT,
+        queue_size: int = settings.CDC.APPLY_QUEUE_SIZE,
+        max_retries: int = settings.CDC.APPLY_MAX_RETRIES,
+        min_lsn: int | None = None,
+        backfill: bool = False,
+    ):
+        """
+        Apply Debezium `ExtractNewRecordState` events to an index with `_bulk` requests.
+        **Parameters**
+        * `source`: where events are read from, offsets are committed to it
+        * `max_actions`, `max_bytes`: size bounds of a bulk request
+        * `max_interval`: seconds the first event of a batch waits for more events
+        * `max_in_flight`: bulk requests sent concurrently
+        * `queue_size`: events read ahead, the source is paused when it is full
+        * `max_retries`: attempts of the throttled or failed actions of a batch
+        * `min_lsn`: events whose `__lsn` is lower are skipped, their rows are already indexed
+        * `backfill`: the events are rows read from Postgres into an index kept up to date
+          by the offsets of a Kafka source
+
+        With a Kafka source, documents are versioned externally with the offsets of the
+        events like the sink connector does, so both can write an index and a batch applied
+        out of order never overwrites a newer document. A backfill writes the version 0,
+        which every event overrides, offsets are applied with `external_gte` so that the
+        event at offset 0 does too. Other sources write unversioned, ES bumps the version
+        of the document by one. Offsets are committed in order, once
+        every earlier batch is acknowledged. The index is in the bulk profile while the
+        events are the reads of a snapshot (`__op` is `r`).
+        """
+        self.source = source
+        self.index_name = index_name
+        self.max_actions = max_actions
+        self.max_bytes = max_bytes
+        self.max_interval = max_interval
+        self.max_in_flight = max_in_flight
+        self.queue_size = queue_size
+        self.max_retries = max_retries
+        self.min_lsn = min_lsn
+        self.backfill = backfill
+        self.stats = ApplyStats()
+
+        self._queue: asyncio.Queue[ChangeEvent | Exception | None] = asyncio.Queue(
+            maxsize=queue_size
+        )
+        self._exhausted = False
+        self._seq = 0
+        self._in_flight: deque[_Batch] = deque()
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._commit_lock = asyncio.Lock()
+        self._tasks: set[asyncio.Task] = set()
+        self._error: BaseException | None = None
+        self._snapshot = False
+
+    async def run(self, es: AsyncElasticsearch) -> None:
+        """
+        Apply events until the source is exhausted, a failed batch is raised.
+        """
+        await self.source.start()
+        reader = asyncio.create_task(self._read())
+        try:
+            while (batch := await self._collect()) is not None:
+                await self._switch_profile(es, batch.snapshot)
+                await self._slots.acquire()
+                self._raise_error()
+                self._in_flight.append(batch)
+                task = asyncio.create_task(self._apply(es, batch))
+                self._tasks.add(task)
+                task.add_done_callback(self._on_done)
+
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            self._raise_error()
+        finally:
+            reader.cancel()
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(reader, *self._tasks, return_exceptions=True)
+            await self.source.stop()
+            await self._restore_profile(es)
+
+    async def _read(self) -> None:
+        try:
+            async for event in self.source.events():
+                await self._queue.put(event)
+        except Exception as e:
+            await self._queue.put(e)
+        else:
+            await self._queue.put(None)
+
+    async def _collect(self) -> _Batch | None:
+        loop = asyncio.get_running_loop()
+        events: dict[Any, ChangeEvent] = {}
+        last_events: dict[tuple[str, int], ChangeEvent] = {}
+        size = 0
+        deadline: float | None = None
+        while len(events) < self.max_actions and size < self.max_bytes:
+            event = await self._next_event(deadline)
+            if event is None:
+                break
+
+            deadline = deadline or loop.time() + self.max_interval
+            self.stats.events += 1
+            last_events[(event.topic, event.partition)] = event
+            if self._skip(event):
+                self.stats.skipped += 1
+                continue
+            size += len(json.dumps(event.value)) if event.value else 0
+            # Only the last change of a row in the batch is sent
+            events.pop(event.id, None)
+            events[event.id] = event
+
+        if not last_events:
+            return None
+
+        # A batch of skipped events only commits their offsets
+        self._seq += 1
+        actions = [self._action(event) for event in events.values()]
+        snapshot = any((event.value or {}).get("__op") == "r" for event in events.values())
+        return _Batch(seq=self._seq, actions=actions, last_events=last_events, snapshot=snapshot)
+
+    def _skip(self, event: ChangeEvent) -> bool:
+        # Deletes are tombstones without `__lsn`, deleting again is harmless
+        lsn = (event.value or {}).get("__lsn")
+        return self.min_lsn is not None and lsn is not None and lsn < self.min_lsn
+
+    async def _next_event(self, deadline: float | None) -> ChangeEvent | None:
+        """
+        Next read event, `None` once `deadline` is passed or the source is exhausted.
+        """
+        if self._exhausted:
+            return None
+
+        timeout = None if deadline is None else deadline - asyncio.get_running_loop().time()
+        if timeout is not None and timeout <= 0:
+            return None
+        try:
+            event = await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+        if isinstance(event, Exception):
+            raise event
+        if event is None:
+            self._exhausted = True
+        return event
+
+    async def _switch_profile(self, es: AsyncElasticsearch, snapshot: bool) -> None:
+        if snapshot != self._snapshot:
+            profile = IndexProfile.bulk if snapshot else IndexProfile.serving
+            await apply_profile(es, profile, self.index_name)
+            self._snapshot = snapshot
+
+    async def _restore_profile(self, es: AsyncElasticsearch) -> None:
+        if not self._snapshot:
+            return
+        try:
+            await self._switch_profile(es, False)
+        except (ApiError, TransportError):
+            logger.exception("could not restore the serving profile of {}", self.index_name)
+
+    def _action(self, event: ChangeEvent) -> tuple[dict[str, Any], dict[str, Any] | None]:
+        meta: dict[str, Any] = {"_index": self.index_name, "_id": str(event.id)}
+        if self.source.offset_versions:
+            meta.update(version=event.offset, version_type="external_gte")
+        elif self.backfill:
+            meta.update(version=0, version_type="external_gte")
+
+        if event.is_delete:
+            return {"delete": meta}, None
+        assert event.value is not None
+        # Debezium metadata such as `__lsn` and `__deleted` is not part of the document
+        document = {key: value for key, value in event.value.items() if not key.startswith("__")}
+        return {"index": meta}, document
+
+    async def _apply(self, es: AsyncElasticsearch, batch: _Batch) -> None:
+        started = time.perf_counter()
+        try:
+            actions = batch.actions
+            for attempt in range(self.max_retries + 1):
+                if attempt:
+                    self.stats.retries += 1
+                    await asyncio.sleep(min(2**attempt * 0.1, 10))
+                try:
+                    actions = self._count_results(actions, await self._bulk(es, actions))
+                except (ApiError, TransportError):
+                    logger.exception("bulk request {} failed, attempt {}", batch.seq, attempt)
+                    continue
+                if not actions:
+                    break
+            else:
+                raise RuntimeError(f"bulk request {batch.seq} still failing after retries")
+        finally:
+            self._slots.release()
+
+        batch.done = True
+        self.stats.batches += 1
+        await self._commit_done()
+
+        last_event = max(batch.last_events.values(), key=lambda event: event.timestamp or 0)
+        cdc_lag.observe_event(last_event)
+        logger.info(
+            "applied batch {} actions={} elapsed={:.3f}s lag={}",
+            batch.seq,
+            len(batch.actions),
+            time.perf_counter() - started,
+            cdc_lag.lag,
+        )
+
+    async def _bulk(
+        self,
+        es: AsyncElasticsearch,
+        actions: list[tuple[dict[str, Any], dict[str, Any] | None]],
+    ) -> list[dict[str, Any]]:
+        if not actions:
+            return []
+        operations: list[dict[str, Any]] = []
+        for action, document in actions:
+            operations.append(action)
+            if document is not None:
+                operations.append(document)
+        response = await es.bulk(operations=operations)
+        return list(response["items"])
+
+    def _count_results(
+        self,
+        actions: list[tuple[dict[str, Any], dict[str, Any] | None]],
+        items: list[dict[str, Any]],
+    ) -> list[tuple[dict[str, Any], dict[str, Any] | None]]:
+        """
+        Update the stats from a bulk response, return the actions to retry.
+        """
+        retry = []
+        for action, item in zip(actions, items, strict=True):
+            op, result = next(iter(item.items()))
+            status = result.get("status", 500)
+            if status < 300 or (op == "delete" and status == 404):
+                if op == "delete":
+                    self.stats.deleted += 1
+                else:
+                    self.stats.indexed += 1
+            elif status == 409:
+                self.stats.conflicts += 1
+            elif status in _RETRY_STATUSES:
+                retry.append(action)
+            else:
+                self.stats.failed += 1
+                logger.error("{} {} rejected: {}", op, result.get("_id"), result.get("error"))
+        return retry
+
+    async def _commit_done(self) -> None:
+        async with self._commit_lock:
+            while self._in_flight and self._in_flight[0].done:
+                batch = self._in_flight.popleft()
+                for event in batch.last_events.values():
+                    await self.source.commit(event)
+
+    def _on_done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None and self._error is None:
+            self._error = task.exception()
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            raise self._error
+
+
+async def _run_worker(topic: str, index_name: str) -> None:
+    backoff = settings.CDC.RESTART_BACKOFF
+    while True:
+        source = create_event_source(
+            topic=topic, group_id=settings.CDC.APPLY_GROUP_ID, auto_offset_reset="earliest"
+        )
+        if source is None:
+            logger.error("CDC.SOURCE is `none`, nothing to apply")
+            return
+
+        worker = BulkApplyWorker(source, index_name=index_name)
+        try:
+            async with async_es_connection.session() as es:
+                await worker.run(es)
+            logger.info("{} change events exhausted, {}", topic, worker.stats)
+            return
+        except Exception:
+            # Offsets of the unacknowledged batches were not committed, they are read again
+            logger.exception(
+                "apply worker of {} failed, restarting in {}s, {}", topic, backoff, worker.stats
+            )
+
+        await asyncio.sleep(backoff)
+        backoff = (
+            settings.CDC.RESTART_BACKOFF
+            if worker.stats.batches
+            else min(backoff * 2, settings.CDC.RESTART_BACKOFF_MAX)
+        )
+
+
+async def run() -> None:
+    async_es_connection.init()
+    workers = [_run_worker(settings.CDC.TOPIC, INDEX_NAME)]
+    # Replaces the sink connector for the heartbeat topic too, the file source has none
+    if settings.CDC.HEARTBEAT_ENABLED and settings.CDC.SOURCE == "kafka":
+        workers.append(_run_worker(settings.CDC.HEARTBEAT_TOPIC, settings.CDC.HEARTBEAT_INDEX))
+    try:
+        await asyncio.gather(*workers)
+    finally:
+        await async_es_connection.close()
+
+
+def main() -> None:
+    make_customize_logger(settings.APP.CONFIG_DIR / "logging.json")
+    logger.info("CDC apply worker starting")
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
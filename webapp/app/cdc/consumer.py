@@ -0,0 +1,101 @@
+import asyncio
+from typing import Awaitable, Callable
+
+from loguru import logger
+
+from app.core.settings import settings
+
+from .events import ChangeEvent
+from .sources import EventSource
+
+__all__ = ["ChangeStreamConsumer", "change_stream"]
+
+EventHandler = Callable[[ChangeEvent], Awaitable[None] | None]
+ResetHandler = Callable[[], Awaitable[None] | None]
+
+
+class ChangeStreamConsumer:
+    def __init__(
+        self,
+        *,
+        backoff: float = settings.CDC.RESTART_BACKOFF,
+        max_backoff: float = settings.CDC.RESTART_BACKOFF_MAX,
+    ) -> None:
+        """
+        Background task dispatching change events to the subscribed handlers.
+
+        When the source fails it is restarted with an exponential backoff. Events may
+        have been missed meanwhile, so the `on_reset` handlers are called first.
+        """
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self.source: EventSource | None = None
+        self.last_event: ChangeEvent | None = None
+
+        self._handlers: list[EventHandler] = []
+        self._reset_handlers: list[ResetHandler] = []
+        self._task: asyncio.Task | None = None
+
+    def subscribe(self, on_event: EventHandler, on_reset: ResetHandler | None = None) -> None:
+        self._handlers.append(on_event)
+        if on_reset is not None:
+            self._reset_handlers.append(on_reset)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, source: EventSource) -> None:
+        assert not self.running, "change stream already started"
+        self.source = source
+        self._task = asyncio.create_task(self._run(source))
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self, source: EventSource) -> None:
+        backoff = self.backoff
+        while True:
+            try:
+                await source.start()
+                async for event in source.events():
+                    await self._dispatch(event)
+                    await source.commit(event)
+                    self.last_event = event
+                    backoff = self.backoff
+                logger.info("change stream source exhausted")
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("change stream failed, restarting in {}s", backoff)
+            finally:
+                await source.stop()
+
+            await self._reset()
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+
+    async def _dispatch(self, event: ChangeEvent) -> None:
+        for handler in self._handlers:
+            result = handler(event)
+            if result is not None:
+                await result
+
+    async def _reset(self) -> None:
+        for handler in self._reset_handlers:
+            result = handler()
+            if result is not None:
+                await result
+
+
+change_stream = ChangeStreamConsumer()
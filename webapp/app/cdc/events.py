@@ -0,0 +1,34 @@
+from dataclasses import dataclass
+from typing import Any
+
+__all__ = ["ChangeEvent"]
+
+
+@dataclass(frozen=True)
+class ChangeEvent:
+    """
+    A Debezium change event after the `ExtractNewRecordState` transform.
+
+    `key` is the row primary key (`{"id": 1}`), `value` the row after the change or
+    `None` for the tombstone following a delete.
+    """
+
+    topic: str
+    partition: int
+    offset: int
+    key: Any
+    value: dict[str, Any] | None
+    # Milliseconds since epoch, as set by the producer
+    timestamp: int | None = None
+
+    @property
+    def id(self) -> Any:
+        if isinstance(self.key, dict) and "id" in self.key:
+            return self.key["id"]
+        if self.value is not None:
+            return self.value.get("id")
+        return self.key
+
+    @property
+    def is_delete(self) -> bool:
+        return self.value is None or str(self.value.get("__deleted", "false")) == "true"
@@ -0,0 +1,208 @@
+import asyncio
+import math
+import time
+from collections import deque
+
+from loguru import logger
+
+from app.core.db_connection import async_db_connection
+from app.core.es_connection import async_es_connection
+from app.core.metrics import CDC_HEARTBEAT_LATENCY, CDC_LAG
+from app.core.settings import settings
+from app.db_repository import heartbeat_db_repository
+from app.es_models.heartbeat import create_index_if_not_exists
+from app.es_repository import heartbeat as heartbeat_es_repository
+
+from .events import ChangeEvent
+from .lag import heartbeat_lag, LagTracker
+from .sources import EventSource, KafkaEventSource
+
+__all__ = ["HeartbeatMonitor", "LatencyWindow", "create_heartbeat_source", "heartbeat_monitor"]
+
+# Stages of a probe, timed from the commit of its row
+STAGES = ("kafka", "elasticsearch")
+PERCENTILES = (50, 95, 99)
+
+
+class LatencyWindow:
+    def __init__(self, size: int = settings.CDC.HEARTBEAT_WINDOW) -> None:
+        """
+        Latencies of the last `size` probes of a stage.
+        """
+        self.samples: deque[float] = deque(maxlen=size)
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        self.samples.append(seconds)
+        self.count += 1
+
+    def percentile(self, percent: float) -> float | None:
+        """
+        Nearest-rank percentile of the window, `None` while it is empty.
+        """
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[max(math.ceil(percent / 100 * len(ordered)) - 1, 0)]
+
+
+class HeartbeatMonitor:
+    def __init__(
+        self,
+        *,
+        id: int = settings.CDC.HEARTBEAT_ID,
+        interval: float = settings.CDC.HEARTBEAT_INTERVAL,
+        poll_interval: float = settings.CDC.HEARTBEAT_POLL_INTERVAL,
+        timeout: float = settings.CDC.HEARTBEAT_TIMEOUT,
+        window: int = settings.CDC.HEARTBEAT_WINDOW,
+        lag: LagTracker = heartbeat_lag,
+    ) -> None:
+        """
+        Background task measuring how far Elasticsearch is behind Postgres.
+        **Parameters**
+        * `id`: heartbeat row written by the probes
+        * `interval`: seconds between the starts of two probes
+        * `poll_interval`: seconds between two searches for the probe
+        * `timeout`: seconds after which a probe that is still not searchable is given up
+        * `window`: probes the percentiles are computed over
+        * `lag`: tracker the current lag is reported to, for `/cdc/lag` and alerting
+
+        Each probe upserts the heartbeat row with the current time and searches the
+        heartbeat index until it holds that time. While a probe is not searchable, the
+        lag reported is the age of the oldest probe not seen yet, so a stalled pipeline
+        shows a growing lag instead of the latency of the last probe. With a source of the
+        heartbeat topic, the time the change event takes to reach Kafka is measured too.
+        """
+        self.id = id
+        self.interval = interval
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.lag = lag
+        self.windows = {stage: LatencyWindow(window) for stage in STAGES}
+
+        # Commit times of the probes not read from the heartbeat topic yet, by `sent_at`
+        self._in_flight: dict[int, float] = {}
+        # Commit time of the oldest probe not searchable yet
+        self._oldest: float | None = None
+        self._last_latency = 0.0
+        self._tasks: list[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    def start(self, source: EventSource | None = None) -> None:
+        """
+        Start probing, `source` reads the heartbeat topic for the Kafka stage.
+        """
+        assert not self.running, "heartbeat monitor already started"
+        self._tasks = [asyncio.create_task(self._run())]
+        if source is not None:
+            self._tasks.append(asyncio.create_task(self._read(source)))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _run(self) -> None:
+        index_ready = False
+        while True:
+            started = time.monotonic()
+            try:
+                if not index_ready:
+                    async with async_es_connection.session() as es:
+                        await create_index_if_not_exists(es)
+                    index_ready = True
+                await self._probe()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("heartbeat probe failed")
+            await asyncio.sleep(max(self.interval - (time.monotonic() - started), 0))
+
+    async def _probe(self) -> None:
+        sent_at = int(time.time() * 1000)
+        async with async_db_connection.session() as db:
+            await heartbeat_db_repository.beat(db, id=self.id, sent_at=sent_at)
+        committed_at = time.monotonic()
+        self._expire(committed_at)
+        self._in_flight[sent_at] = committed_at
+        if self._oldest is None:
+            self._oldest = committed_at
+        oldest = self._oldest
+
+        async with async_es_connection.session() as es:
+            while True:
+                indexed = await heartbeat_es_repository.sent_at(es, self.id)
+                now = time.monotonic()
+                if indexed is not None and indexed >= sent_at:
+                    self._observe("elasticsearch", now - committed_at)
+                    self._last_latency = now - committed_at
+                    self._oldest = None
+                    self._report(self._last_latency)
+                    return
+
+                self._report(max(now - oldest, self._last_latency))
+                if now - committed_at >= self.timeout:
+                    logger.warning(
+                        "heartbeat {} still not searchable after {}s", sent_at, self.timeout
+                    )
+                    return
+                await asyncio.sleep(self.poll_interval)
+
+    async def _read(self, source: EventSource) -> None:
+        while True:
+            try:
+                await source.start()
+                async for event in source.events():
+                    self._on_event(event)
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception(
+                    "heartbeat topic failed, restarting in {}s", settings.CDC.RESTART_BACKOFF
+                )
+            finally:
+                await source.stop()
+            await asyncio.sleep(settings.CDC.RESTART_BACKOFF)
+
+    def _on_event(self, event: ChangeEvent) -> None:
+        if event.id != self.id or event.value is None:
+            return
+        # The row only moves forward, an event carries every probe sent before its value
+        received_at = time.monotonic()
+        sent_at = int(event.value["sent_at"])
+        for probe in [probe for probe in self._in_flight if probe <= sent_at]:
+            self._observe("kafka", received_at - self._in_flight.pop(probe))
+
+    def _expire(self, now: float) -> None:
+        # Probes never read from the topic, or read by no source at all
+        self._in_flight = {
+            sent_at: committed_at
+            for sent_at, committed_at in self._in_flight.items()
+            if now - committed_at < self.timeout
+        }
+
+    def _observe(self, stage: str, seconds: float) -> None:
+        self.windows[stage].observe(seconds)
+        CDC_HEARTBEAT_LATENCY.labels(stage=stage).observe(seconds)
+
+    def _report(self, lag: float) -> None:
+        self.lag.observe(lag)
+        CDC_LAG.set(lag)
+
+
+def create_heartbeat_source() -> EventSource | None:
+    """
+    Source of the heartbeat topic, without a group so that every process reads every
+    probe. Only Kafka has one.
+    """
+    if settings.CDC.SOURCE == "kafka":
+        return KafkaEventSource(topic=settings.CDC.HEARTBEAT_TOPIC)
+    return None
+
+
+heartbeat_monitor = HeartbeatMonitor()
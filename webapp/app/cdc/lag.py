@@ -0,0 +1,42 @@
+import time
+
+from app.core.settings import settings
+
+from .events import ChangeEvent
+
+__all__ = ["LagTracker", "cdc_lag", "heartbeat_lag"]
+
+
+class LagTracker:
+    def __init__(self, *, stale_after: float = settings.READ.LAG_STALE_AFTER) -> None:
+        """
+        Last measured delay of the replication of a change in Postgres.
+        A measure older than `stale_after` seconds is reported as unknown.
+        """
+        self.stale_after = stale_after
+
+        self._lag: float | None = None
+        self._observed_at = 0.0
+
+    @property
+    def lag(self) -> float | None:
+        if self._lag is None or time.monotonic() - self._observed_at > self.stale_after:
+            return None
+        return self._lag
+
+    def observe(self, lag: float) -> None:
+        self._lag = max(lag, 0.0)
+        self._observed_at = time.monotonic()
+
+    def observe_event(self, event: ChangeEvent) -> None:
+        # Commit time in Postgres when Debezium adds it, else the Kafka timestamp
+        timestamp = (event.value or {}).get("__source_ts_ms") or event.timestamp
+        if timestamp is not None:
+            self.observe(time.time() - timestamp / 1000)
+
+
+# Until the change event reaches this process
+cdc_lag = LagTracker()
+# Until the change is searchable in Elasticsearch, measured by the heartbeat probes, refresh
+# interval included
+heartbeat_lag = LagTracker()
@@ -0,0 +1,292 @@
+import asyncio
+import json
+from pathlib import Path
+from typing import Any, AsyncIterator
+
+from aiokafka import AIOKafkaConsumer, TopicPartition
+
+from app.core.settings import settings
+
+from .events import ChangeEvent
+
+__all__ = [
+    "EventSource",
+    "FileEventSource",
+    "KafkaEventSource",
+    "MemoryEventSource",
+    "create_event_source",
+    "create_replay_source",
+]
+
+
+class EventSource:
+    """
+    Where change events are read from, `events()` yields them in offset order.
+    """
+
+    # Offsets order the changes of a row the way the sink connector versions documents
+    offset_versions = False
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    def events(self) -> AsyncIterator[ChangeEvent]:
+        raise NotImplementedError
+
+    async def commit(self, event: ChangeEvent) -> None:
+        """
+        Mark every event up to and including `event` as processed.
+        """
+
+
+class MemoryEventSource(EventSource):
+    def __init__(self, topic: str = settings.CDC.TOPIC, *, maxsize: int = 0):
+        """
+        In-memory source fed with `publish`, a stand-in for Kafka in tests and scripts.
+        **Parameters**
+        * `maxsize`: events buffered before `put` waits for them to be read, unbounded at 0
+        """
+        self.topic = topic
+        self.committed: int | None = None
+
+        self._queue: asyncio.Queue[ChangeEvent | None] = asyncio.Queue(maxsize=maxsize)
+        self._offset = 0
+
+    def _event(self, key: Any, value: dict[str, Any] | None) -> ChangeEvent:
+        event = ChangeEvent(
+            topic=self.topic, partition=0, offset=self._offset, key=key, value=value
+        )
+        self._offset += 1
+        return event
+
+    def publish(self, key: Any, value: dict[str, Any] | None) -> ChangeEvent:
+        event = self._event(key, value)
+        self._queue.put_nowait(event)
+        return event
+
+    async def put(self, key: Any, value: dict[str, Any] | None) -> ChangeEvent:
+        """
+        Like `publish`, waiting while `maxsize` events are buffered.
+        """
+        event = self._event(key, value)
+        await self._queue.put(event)
+        return event
+
+    async def close(self) -> None:
+        """
+        End `events()` once the events published before are read.
+        """
+        await self._queue.put(None)
+
+    async def events(self) -> AsyncIterator[ChangeEvent]:
+        while (event := await self._queue.get()) is not None:
+            yield event
+
+    async def commit(self, event: ChangeEvent) -> None:
+        self.committed = event.offset
+
+
+class FileEventSource(EventSource):
+    def __init__(
+        self,
+        path: Path,
+        *,
+        topic: str = settings.CDC.TOPIC,
+        follow: bool = True,
+        poll_interval: float = 0.5,
+    ):
+        """
+        Read events from a NDJSON file of `{"key": ..., "value": ..., "timestamp": ...}`.
+        **Parameters**
+        * `path`: file to read, the line number is used as offset
+        * `follow`: keep waiting for appended lines at the end of the file
+        * `poll_interval`: seconds between checks for appended lines
+        """
+        self.path = path
+        self.topic = topic
+        self.follow = follow
+        self.poll_interval = poll_interval
+        self.committed: int | None = None
+
+    async def events(self) -> AsyncIterator[ChangeEvent]:
+        offset = 0
+        partial = ""
+        with self.path.open(encoding="utf-8") as f:
+            while True:
+                line = await asyncio.to_thread(f.readline)
+                if not line or not line.endswith("\n"):
+                    # Keep a line that is still being written until its newline arrives
+                    partial += line
+                    if not self.follow:
+                        break
+                    await asyncio.sleep(self.poll_interval)
+                    continue
+
+                line, partial = partial + line, ""
+                if line.strip():
+                    record = json.loads(line)
+                    yield ChangeEvent(
+                        topic=self.topic,
+                        partition=0,
+                        offset=offset,
+                        key=record.get("key"),
+                        value=record.get("value"),
+                        timestamp=record.get("timestamp"),
+                    )
+                offset += 1
+
+        if partial.strip():
+            raise ValueError(f"{self.path}: truncated last line")
+
+    async def commit(self, event: ChangeEvent) -> None:
+        self.committed = event.offset
+
+
+def _json_deserializer(data: bytes | None) -> Any:
+    return json.loads(data) if data else None
+
+
+class KafkaEventSource(EventSource):
+    offset_versions = True
+
+    def __init__(
+        self,
+        *,
+        bootstrap_servers: str = settings.CDC.KAFKA_BOOTSTRAP_SERVERS,
+        topic: str = settings.CDC.TOPIC,
+        group_id: str | None = None,
+        auto_offset_reset: str = "latest",
+        start_timestamp: int | None = None,
+        stop_at_end: bool = False,
+    ):
+        """
+        Read the Debezium topic with `aiokafka`.
+        **Parameters**
+        * `group_id`: consumer group committing offsets, `None` reads the topic without a
+          group so that every process receives every event
+        * `auto_offset_reset`: where to start without a committed offset
+        * `start_timestamp`: replay the events produced since this epoch in milliseconds
+        * `stop_at_end`: end `events()` at the end offsets of the partitions at start
+
+        With `start_timestamp` or `stop_at_end` every partition is assigned to the
+        consumer instead of subscribing with the group.
+        """
+        self.bootstrap_servers = bootstrap_servers
+        self.topic = topic
+        self.group_id = group_id
+        self.auto_offset_reset = auto_offset_reset
+        self.start_timestamp = start_timestamp
+        self.stop_at_end = stop_at_end
+
+        self.consumer: AIOKafkaConsumer | None = None
+        # Offsets `events()` stops at, by partition
+        self.end_offsets: dict[TopicPartition, int] | None = None
+
+    async def start(self) -> None:
+        replay = self.start_timestamp is not None or self.stop_at_end
+        self.consumer = AIOKafkaConsumer(
+            *([] if replay else [self.topic]),
+            bootstrap_servers=self.bootstrap_servers,
+            group_id=self.group_id,
+            auto_offset_reset=self.auto_offset_reset,
+            enable_auto_commit=False,
+            key_deserializer=_json_deserializer,
+            value_deserializer=_json_deserializer,
+        )
+        await self.consumer.start()
+        if replay:
+            await self._assign(self.consumer)
+
+    async def _assign(self, consumer: AIOKafkaConsumer) -> None:
+        await consumer.topics()
+        partitions = [
+            TopicPartition(self.topic, partition)
+            for partition in consumer.partitions_for_topic(self.topic) or []
+        ]
+        consumer.assign(partitions)
+        end_offsets = await consumer.end_offsets(partitions)
+
+        if self.start_timestamp is not None:
+            offsets = await consumer.offsets_for_times(
+                dict.fromkeys(partitions, self.start_timestamp)
+            )
+            for partition in partitions:
+                found = offsets.get(partition)
+                # Nothing was produced since the timestamp in this partition
+                consumer.seek(partition, found.offset if found else end_offsets[partition])
+
+        if self.stop_at_end:
+            self.end_offsets = {
+                partition: offset
+                for partition, offset in end_offsets.items()
+                if await consumer.position(partition) < offset
+            }
+
+    async def stop(self) -> None:
+        if self.consumer is not None:
+            await self.consumer.stop()
+            self.consumer = None
+
+    async def events(self) -> AsyncIterator[ChangeEvent]:
+        assert self.consumer is not None, "must call start() before"
+        if self.end_offsets == {}:
+            return
+
+        async for message in self.consumer:
+            yield ChangeEvent(
+                topic=message.topic,
+                partition=message.partition,
+                offset=message.offset,
+                key=message.key,
+                value=message.value,
+                timestamp=message.timestamp,
+            )
+            if self._reached_end(TopicPartition(message.topic, message.partition), message.offset):
+                return
+
+    def _reached_end(self, partition: TopicPartition, offset: int) -> bool:
+        if self.end_offsets is None:
+            return False
+        if offset + 1 >= self.end_offsets.get(partition, 0):
+            self.end_offsets.pop(partition, None)
+        return not self.end_offsets
+
+    async def commit(self, event: ChangeEvent) -> None:
+        if self.consumer is None or self.group_id is None:
+            return
+        partition = TopicPartition(event.topic, event.partition)
+        await self.consumer.commit({partition: event.offset + 1})
+
+
+def create_event_source(
+    *,
+    topic: str = settings.CDC.TOPIC,
+    group_id: str | None = None,
+    auto_offset_reset: str = "latest",
+) -> EventSource | None:
+    if settings.CDC.SOURCE == "kafka":
+        return KafkaEventSource(topic=topic, group_id=group_id, auto_offset_reset=auto_offset_reset)
+    if settings.CDC.SOURCE == "file":
+        if settings.CDC.FILE_PATH is None:
+            raise RuntimeError("CDC.FILE_PATH must be set when CDC.SOURCE is `file`")
+        return FileEventSource(settings.CDC.FILE_PATH, topic=topic)
+    return None
+
+
+def create_replay_source(since: int) -> EventSource | None:
+    """
+    Source of the events produced since the `since` epoch in milliseconds, exhausted
+    once it reaches the events produced when it starts.
+
+    A file source is replayed from its first line.
+    """
+    if settings.CDC.SOURCE == "kafka":
+        return KafkaEventSource(start_timestamp=since, stop_at_end=True)
+    if settings.CDC.SOURCE == "file":
+        if settings.CDC.FILE_PATH is None:
+            raise RuntimeError("CDC.FILE_PATH must be set when CDC.SOURCE is `file`")
+        return FileEventSource(settings.CDC.FILE_PATH, follow=False)
+    return None
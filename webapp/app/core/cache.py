@@ -0,0 +1,143 @@
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Generic, Hashable, TypeVar
+
+__all__ = ["CacheCounters", "LRUCache", "QueryResultCache"]
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+@dataclass
+class CacheCounters:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    invalidations: int = 0
+
+
+class LRUCache(Generic[K, V]):
+    def __init__(
+        self,
+        *,
+        max_size: int,
+        ttl: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Bounded in-process cache, least recently used entries are evicted first.
+        **Parameters**
+        * `max_size`: maximum number of entries, `0` disables the cache
+        * `ttl`: seconds an entry is served before it is reloaded
+        * `clock`: monotonic time source
+
+        Every invalidation bumps `epoch`. A value loaded before an invalidation is not
+        stored, so a slow read can't put back a row that changed while it was loading.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.counters = CacheCounters()
+        self.epoch = 0
+
+        self._entries: OrderedDict[K, tuple[float, V]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: K) -> V | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.counters.misses += 1
+            return None
+
+        expires_at, value = entry
+        if expires_at <= self.clock():
+            del self._entries[key]
+            self.counters.expirations += 1
+            self.counters.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.counters.hits += 1
+        return value
+
+    def set(self, key: K, value: V, *, epoch: int | None = None) -> None:
+        if self.max_size <= 0 or (epoch is not None and epoch != self.epoch):
+            return
+
+        self._entries[key] = (self.clock() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.counters.evictions += 1
+
+    def invalidate(self, key: K) -> None:
+        self.epoch += 1
+        self.counters.invalidations += 1
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self.epoch += 1
+        self.counters.invalidations += 1
+        self._entries.clear()
+
+    async def get_or_load(self, key: K, load: Callable[[K], Awaitable[V | None]]) -> V | None:
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        epoch = self.epoch
+        value = await load(key)
+        if value is not None:
+            self.set(key, value, epoch=epoch)
+        return value
+
+
+class QueryResultCache(LRUCache[str, Any]):
+    def __init__(
+        self,
+        *,
+        max_size: int,
+        ttl: float,
+        refresh_delay: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Cache of search results, cleared as a whole on every write to the index.
+        **Parameters**
+        * `refresh_delay`: seconds until a write is searchable, the refresh interval of
+          the index
+
+        A search run between a write and the next refresh doesn't see the write yet, so
+        the cache is cleared again once `refresh_delay` has passed since the last write.
+        """
+        super().__init__(max_size=max_size, ttl=ttl, clock=clock)
+        self.refresh_delay = refresh_delay
+
+        self._clear_at: float | None = None
+        self._timer: asyncio.TimerHandle | None = None
+
+    def on_write(self) -> None:
+        self.clear()
+        self._clear_at = self.clock() + self.refresh_delay
+        if self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(
+                self.refresh_delay, self._on_refresh
+            )
+
+    def _on_refresh(self) -> None:
+        self._timer = None
+        if self._clear_at is None:
+            return
+
+        remaining = self._clear_at - self.clock()
+        if remaining > 0:
+            # Written again since the timer was set
+            self._timer = asyncio.get_running_loop().call_later(remaining, self._on_refresh)
+            return
+        self._clear_at = None
+        self.clear()
@@ -1,10 +1,11 @@
 from contextlib import asynccontextmanager, contextmanager
 from functools import wraps
-from typing import AsyncGenerator, Awaitable, Callable, Iterator, ParamSpec, TypeVar
+from itertools import cycle
+from typing import Any, AsyncGenerator, Awaitable, Callable, Iterator, ParamSpec, TypeVar
 
 from loguru import logger
-from sqlalchemy import create_engine
-from sqlalchemy.engine import Engine
+from sqlalchemy import create_engine, Select
+from sqlalchemy.engine import Connection, Engine
 from sqlalchemy.ext.asyncio import (
     async_sessionmaker,
     AsyncEngine,
@@ -12,16 +13,76 @@ from sqlalchemy.ext.asyncio import (
     create_async_engine,
 )
 from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.sql import Executable
 
+from app.core.metrics import instrument_engine, InstrumentedPool
+from app.core.profiling import profile_engine
 from app.core.settings import settings
 
 Param = ParamSpec("Param")
 RetType = TypeVar("RetType")
 
+_USE_PRIMARY = "use_primary"
+
+
+class RoutingSession(Session):
+    """Session sending plain SELECTs to a read replica and everything else to the primary
+
+    The replica is picked round-robin from `replicas` once per session, so a request sees
+    a single replica. Other statements, such as `text()` ones, are reads when they have
+    the `read_only` execution option. With `pin_primary_after_write`, reads that follow
+    a write in the same session go to the primary to read their own writes. Sessions
+    passed to `use_primary` read from the primary too, to see the writes of earlier ones.
+    """
+
+    def __init__(
+        self,
+        *args: Any,
+        replicas: Iterator[Engine] | None = None,
+        pin_primary_after_write: bool = True,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self.replicas = replicas
+        self.pin_primary_after_write = pin_primary_after_write
+        self.replica: Engine | None = None
+        self.wrote = False
+
+    def get_bind(self, mapper: Any = None, clause: Any = None, **kw: Any) -> Engine | Connection:
+        is_read = not self._flushing and (
+            (isinstance(clause, Select) and getattr(clause, "_for_update_arg", None) is None)
+            # Textual statements can't be told apart, they are writes unless marked
+            or (
+                isinstance(clause, Executable)
+                and clause.get_execution_options().get("read_only", False)
+            )
+        )
+        if not is_read:
+            self.wrote = True
+
+        if (
+            self.replicas is None
+            or not is_read
+            or self.info.get(_USE_PRIMARY, False)
+            or (self.wrote and self.pin_primary_after_write)
+        ):
+            return super().get_bind(mapper, clause=clause, **kw)
+
+        if self.replica is None:
+            self.replica = next(self.replicas)
+        return self.replica
+
+
+def use_primary(db: AsyncSession) -> None:
+    """Send the reads of `db` to the primary, for reads that replicas may be behind on"""
+    db.info[_USE_PRIMARY] = True
+
 
 class AsyncDbConnection:
     def __init__(self) -> None:
         self.engine: AsyncEngine | None = None
+        self.replica_engines: list[AsyncEngine] = []
         self.session_maker: async_sessionmaker[AsyncSession] | None = None
 
     def init(
@@ -30,20 +91,38 @@ class AsyncDbConnection:
         max_overflow: int = settings.SQLALCHEMY.MAX_OVERFLOW,
         pool_timeout: int = settings.SQLALCHEMY.POOL_TIMEOUT,
     ) -> None:
-        self.engine = create_async_engine(
-            settings.DB.ASYNC_DATABASE_URI,
-            echo=settings.SQLALCHEMY.ECHO,
-            pool_pre_ping=True,
-            future=True,
-            pool_size=pool_size,
-            max_overflow=max_overflow,
-            pool_timeout=pool_timeout,
-        )
+        self.engine, *self.replica_engines = [
+            create_async_engine(
+                uri,
+                echo=settings.SQLALCHEMY.ECHO,
+                pool_pre_ping=True,
+                future=True,
+                pool_size=pool_size,
+                max_overflow=max_overflow,
+                pool_timeout=pool_timeout,
+                poolclass=InstrumentedPool if settings.METRICS.ENABLED else AsyncAdaptedQueuePool,
+            )
+            for uri in [settings.DB.ASYNC_DATABASE_URI, *settings.DB.ASYNC_REPLICA_URIS]
+        ]
+        if settings.METRICS.ENABLED:
+            instrument_engine(self.engine, "primary")
+            for i, engine in enumerate(self.replica_engines):
+                instrument_engine(engine, f"replica-{i}")
+        if settings.PROFILING.ENABLED:
+            for engine in [self.engine, *self.replica_engines]:
+                profile_engine(engine)
         self.session_maker = async_sessionmaker(
             self.engine,
             expire_on_commit=False,
             autoflush=False,
             autocommit=False,
+            sync_session_class=RoutingSession,
+            replicas=(
+                cycle([engine.sync_engine for engine in self.replica_engines])
+                if self.replica_engines
+                else None
+            ),
+            pin_primary_after_write=settings.DB.PIN_PRIMARY_AFTER_WRITE,
         )
 
     async def close(self) -> None:
@@ -52,7 +131,10 @@ class AsyncDbConnection:
             return
 
         await self.engine.dispose()
+        for engine in self.replica_engines:
+            await engine.dispose()
         self.engine = None
+        self.replica_engines = []
         self.session_marker = None
 
     @asynccontextmanager
@@ -2,9 +2,11 @@ from contextlib import asynccontextmanager, contextmanager
 from functools import wraps
 from typing import AsyncGenerator, Awaitable, Callable, Iterator, ParamSpec, TypeVar
 
+from elastic_transport import AiohttpHttpNode
 from elasticsearch import AsyncElasticsearch, Elasticsearch
 from loguru import logger
 
+from app.core.metrics import InstrumentedAiohttpNode
 from app.core.settings import settings
 
 Param = ParamSpec("Param")
@@ -28,6 +30,11 @@ class AsyncESConnection:
             max_retries=max_retries,
             retry_on_timeout=retry_on_timeout,
             connections_per_node=connections_per_node,
+            node_class=(
+                InstrumentedAiohttpNode
+                if settings.METRICS.ENABLED or settings.PROFILING.ENABLED
+                else AiohttpHttpNode
+            ),
         )
 
     async def close(self) -> None:
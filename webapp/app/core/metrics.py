@@ -0,0 +1,304 @@
+import asyncio
+import inspect
+import os
+import time
+from functools import wraps
+from typing import Any, Awaitable, Callable, ParamSpec, Sequence, TypeVar
+
+from elastic_transport import AiohttpHttpNode, HttpHeaders, NodeConfig
+from elastic_transport.client_utils import DEFAULT, DefaultType
+from loguru import logger
+from prometheus_client import (
+    CollectorRegistry,
+    Gauge,
+    generate_latest,
+    Histogram,
+    multiprocess,
+    REGISTRY,
+)
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, ConnectionPoolEntry
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.profiling import record_es_request
+from app.core.settings import settings
+
+__all__ = [
+    "InstrumentedAiohttpNode",
+    "InstrumentedPool",
+    "LoopLagMonitor",
+    "MetricsMiddleware",
+    "instrument_engine",
+    "instrument_methods",
+    "loop_lag_monitor",
+    "mark_process_dead",
+    "render_metrics",
+]
+
+Param = ParamSpec("Param")
+RetType = TypeVar("RetType")
+
+# Set by prometheus_client users to aggregate the workers of a multi-process server
+_MULTIPROC_DIR = "PROMETHEUS_MULTIPROC_DIR"
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Duration of HTTP requests by route template",
+    ["method", "route", "status"],
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out",
+    "Connections checked out of the SQLAlchemy pool",
+    ["pool"],
+    multiprocess_mode="livesum",
+)
+DB_POOL_OVERFLOW = Gauge(
+    "db_pool_overflow",
+    "Connections opened over the pool size, negative while the pool is not full",
+    ["pool"],
+    multiprocess_mode="livesum",
+)
+DB_POOL_SIZE = Gauge(
+    "db_pool_size", "Configured size of the SQLAlchemy pool", ["pool"], multiprocess_mode="livesum"
+)
+DB_POOL_WAIT = Histogram(
+    "db_pool_wait_seconds",
+    "Time a checkout waited for a pooled connection, including opening a new one",
+    ["pool"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60),
+)
+ES_CONNECTIONS_IN_USE = Gauge(
+    "es_connections_in_use",
+    "Elasticsearch requests in flight by node, each holding a connection",
+    ["node"],
+    multiprocess_mode="livesum",
+)
+ES_CONNECTIONS_MAX = Gauge(
+    "es_connections_max",
+    "Connections the Elasticsearch client opens at most by node",
+    ["node"],
+    multiprocess_mode="livesum",
+)
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds",
+    "Delay of the event loop running a timer past its deadline",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+CDC_HEARTBEAT_LATENCY = Histogram(
+    "cdc_heartbeat_latency_seconds",
+    "Time from the commit of a heartbeat row until it is in Kafka, and searchable in Elasticsearch",
+    ["stage"],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+CDC_LAG = Gauge(
+    "cdc_lag_seconds",
+    "Current delay of Elasticsearch behind Postgres, the age of the oldest probe not yet "
+    "searchable or the latency of the last one",
+    multiprocess_mode="livemax",
+)
+
+_call_histograms: dict[str, Histogram] = {}
+
+
+def _call_histogram(name: str) -> Histogram:
+    if name not in _call_histograms:
+        _call_histograms[name] = Histogram(
+            name, "Duration of repository calls", ["repository", "method"]
+        )
+    return _call_histograms[name]
+
+
+def _timed(
+    func: Callable[Param, Awaitable[RetType]], histogram: Histogram
+) -> Callable[Param, Awaitable[RetType]]:
+    @wraps(func)
+    async def wrapper(*args: Param.args, **kwargs: Param.kwargs) -> RetType:
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - started)
+
+    return wrapper
+
+
+def instrument_methods(obj: Any, methods: Sequence[tuple[str, str]], *, repository: str) -> None:
+    """
+    Time the calls of the coroutine methods of `obj`.
+    **Parameters**
+    * `methods`: `(method, histogram)` pairs, such as the `metrics_histogram` of a
+      repository, the histogram is created on first use
+    * `repository`: `repository` label of the observations
+    """
+    if not settings.METRICS.ENABLED:
+        return
+    for method, name in methods:
+        func = getattr(obj, method)
+        if not inspect.iscoroutinefunction(func):
+            raise TypeError(f"{type(obj).__name__}.{method} is not a coroutine method")
+        labeled = _call_histogram(name).labels(repository=repository, method=method)
+        setattr(obj, method, _timed(func, labeled))
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        """
+        ASGI middleware timing HTTP requests by method, route template and status.
+        Unlike `BaseHTTPMiddleware` it adds no task per request, streamed responses are
+        timed until their last chunk.
+        """
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # Set by the router, the template keeps the label values bounded
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUEST_DURATION.labels(
+                method=scope["method"], route=route, status=str(status)
+            ).observe(time.perf_counter() - started)
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """
+    `AsyncAdaptedQueuePool` reporting how long checkouts wait for a connection and how
+    many connections are checked out, set `metrics_name` with `instrument_engine`.
+    """
+
+    metrics_name = "default"
+
+    def _do_get(self) -> ConnectionPoolEntry:
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_WAIT.labels(pool=self.metrics_name).observe(time.perf_counter() - started)
+            self._report_usage()
+
+    def _do_return_conn(self, record: ConnectionPoolEntry) -> None:
+        super()._do_return_conn(record)
+        self._report_usage()
+
+    def _report_usage(self) -> None:
+        # The counters are only up to date once the connection left or joined the queue,
+        # the checkout and checkin events run before
+        DB_POOL_CHECKED_OUT.labels(pool=self.metrics_name).set(self.checkedout())
+        DB_POOL_OVERFLOW.labels(pool=self.metrics_name).set(self.overflow())
+
+    def recreate(self) -> "InstrumentedPool":
+        pool = super().recreate()
+        assert isinstance(pool, InstrumentedPool)
+        pool.metrics_name = self.metrics_name
+        return pool
+
+
+def instrument_engine(engine: AsyncEngine, name: str) -> None:
+    """
+    Report the pool of `engine` as the `name` pool, when it is an `InstrumentedPool`.
+    """
+    pool = engine.sync_engine.pool
+    if isinstance(pool, InstrumentedPool):
+        pool.metrics_name = name
+        DB_POOL_SIZE.labels(pool=name).set(pool.size())
+
+
+class InstrumentedAiohttpNode(AiohttpHttpNode):
+    """
+    Default node of `AsyncElasticsearch` counting the requests in flight, a request
+    holds one of the `connections_per_node` connections of its node. Requests are timed
+    into the profile of the current request as well.
+    """
+
+    def __init__(self, config: NodeConfig) -> None:
+        super().__init__(config)
+        ES_CONNECTIONS_MAX.labels(node=self.base_url).set(config.connections_per_node)
+
+    async def perform_request(  # type: ignore[override]
+        self,
+        method: str,
+        target: str,
+        body: bytes | None = None,
+        headers: HttpHeaders | None = None,
+        request_timeout: DefaultType | float | None = DEFAULT,
+    ) -> Any:
+        in_use = ES_CONNECTIONS_IN_USE.labels(node=self.base_url)
+        in_use.inc()
+        started = time.perf_counter()
+        try:
+            return await super().perform_request(
+                method, target, body=body, headers=headers, request_timeout=request_timeout
+            )
+        finally:
+            in_use.dec()
+            record_es_request(time.perf_counter() - started)
+
+
+class LoopLagMonitor:
+    def __init__(self, *, interval: float = settings.METRICS.LOOP_LAG_INTERVAL) -> None:
+        """
+        Background task sleeping `interval` seconds at a time, the extra time it takes to
+        wake up is the event loop lag: callbacks blocking the loop delay every request.
+        """
+        self.interval = interval
+
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        assert self._task is None, "loop lag monitor already started"
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            EVENT_LOOP_LAG.observe(max(loop.time() - started - self.interval, 0.0))
+
+
+loop_lag_monitor = LoopLagMonitor()
+
+
+def render_metrics() -> bytes:
+    """
+    Metrics in the Prometheus text format, of every worker in multi-process mode.
+    """
+    if _MULTIPROC_DIR not in os.environ:
+        return generate_latest(REGISTRY)
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)  # type: ignore[no-untyped-call]
+    return generate_latest(registry)
+
+
+def mark_process_dead() -> None:
+    """
+    Drop the live gauges of this worker from the multi-process metrics, on shutdown.
+    """
+    if _MULTIPROC_DIR in os.environ:
+        multiprocess.mark_process_dead(os.getpid())  # type: ignore[no-untyped-call]
+        logger.info("metrics of worker {} marked dead", os.getpid())
@@ -0,0 +1,208 @@
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Iterator
+
+import orjson
+from loguru import logger
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.settings import settings
+
+__all__ = [
+    "ProfilingMiddleware",
+    "RequestProfile",
+    "profile_engine",
+    "record_es_request",
+    "serialization_timer",
+]
+
+
+@dataclass
+class _SlowStatement:
+    engine: AsyncEngine
+    statement: str
+    parameters: Any
+    duration: float
+
+
+@dataclass
+class RequestProfile:
+    db_statements: int = 0
+    db_time: float = 0.0
+    es_requests: int = 0
+    es_time: float = 0.0
+    serialization_time: float = 0.0
+    # Sampled for `EXPLAIN`, its slow SELECTs are kept
+    explain: bool = False
+    slow_statements: list[_SlowStatement] = field(default_factory=list)
+
+    def server_timing(self, total: float) -> str:
+        """
+        `Server-Timing` header value, durations in milliseconds.
+        """
+        return ", ".join(
+            [
+                f'db;dur={self.db_time * 1000:.1f};desc="{self.db_statements} statements"',
+                f'es;dur={self.es_time * 1000:.1f};desc="{self.es_requests} requests"',
+                f"serialize;dur={self.serialization_time * 1000:.1f}",
+                f"total;dur={total * 1000:.1f}",
+            ]
+        )
+
+    def record(self) -> dict[str, Any]:
+        return {
+            "db_statements": self.db_statements,
+            "db_ms": round(self.db_time * 1000, 1),
+            "es_requests": self.es_requests,
+            "es_ms": round(self.es_time * 1000, 1),
+            "serialization_ms": round(self.serialization_time * 1000, 1),
+        }
+
+
+# Set for the duration of a request by `ProfilingMiddleware`, copied to the tasks and
+# greenlets the request starts
+_profile: ContextVar[RequestProfile | None] = ContextVar("request_profile", default=None)
+
+
+def record_es_request(seconds: float) -> None:
+    profile = _profile.get()
+    if profile is not None:
+        profile.es_requests += 1
+        profile.es_time += seconds
+
+
+@contextmanager
+def serialization_timer() -> Iterator[None]:
+    """
+    Add the time spent in the block to the serialization time of the request.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile = _profile.get()
+        if profile is not None:
+            profile.serialization_time += time.perf_counter() - started
+
+
+def profile_engine(
+    engine: AsyncEngine,
+    *,
+    explain_min_duration: float = settings.PROFILING.EXPLAIN_MIN_DURATION,
+) -> None:
+    """
+    Count and time the statements `engine` runs into the profile of the current request.
+    """
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def before_cursor_execute(
+        conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool
+    ) -> None:
+        context._profile_started = time.perf_counter()
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def after_cursor_execute(
+        conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool
+    ) -> None:
+        profile = _profile.get()
+        if profile is None:
+            return
+
+        duration = time.perf_counter() - context._profile_started
+        profile.db_statements += 1
+        profile.db_time += duration
+        # `EXPLAIN ANALYZE` runs the statement, only reads are run again
+        if (
+            profile.explain
+            and duration >= explain_min_duration
+            and not executemany
+            and statement.lstrip()[:6].upper() == "SELECT"
+        ):
+            profile.slow_statements.append(_SlowStatement(engine, statement, parameters, duration))
+
+
+class ProfilingMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        *,
+        slow_request: float = settings.PROFILING.SLOW_REQUEST,
+        explain_sample_rate: float = settings.PROFILING.EXPLAIN_SAMPLE_RATE,
+        explain_max_statements: int = settings.PROFILING.EXPLAIN_MAX_STATEMENTS,
+    ) -> None:
+        """
+        ASGI middleware profiling each request.
+        **Parameters**
+        * `slow_request`: seconds over which the request is logged with its profile
+        * `explain_sample_rate`: share of the requests whose slow SELECTs are explained
+        * `explain_max_statements`: slowest SELECTs explained per sampled request
+
+        The `Server-Timing` header holds what was spent until the response started, the
+        log of a slow request everything up to its last chunk. Explained statements run
+        again on their engine once the response is sent.
+        """
+        self.app = app
+        self.slow_request = slow_request
+        self.explain_sample_rate = explain_sample_rate
+        self.explain_max_statements = explain_max_statements
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(explain=random.random() < self.explain_sample_rate)
+        token = _profile.set(profile)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                timing = profile.server_timing(time.perf_counter() - started)
+                MutableHeaders(scope=message).append("Server-Timing", timing)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _profile.reset(token)
+            elapsed = time.perf_counter() - started
+            if elapsed >= self.slow_request:
+                record = {
+                    "method": scope["method"],
+                    "route": getattr(scope.get("route"), "path", scope["path"]),
+                    "status": status,
+                    "duration_ms": round(elapsed * 1000, 1),
+                    **profile.record(),
+                }
+                # Bound for structured sinks, in the message for the text ones
+                logger.bind(profile=record).warning(
+                    "slow request {}", orjson.dumps(record).decode()
+                )
+
+        await self._explain(profile)
+
+    async def _explain(self, profile: RequestProfile) -> None:
+        slowest = sorted(profile.slow_statements, key=lambda slow: slow.duration, reverse=True)
+        for slow in slowest[: self.explain_max_statements]:
+            try:
+                async with slow.engine.connect() as conn:
+                    result = await conn.exec_driver_sql(
+                        f"EXPLAIN (ANALYZE, BUFFERS) {slow.statement}", slow.parameters
+                    )
+                    plan = "\n".join(row[0] for row in result)
+                    await conn.rollback()
+            except Exception:
+                logger.exception("could not explain {}", slow.statement)
+                continue
+            logger.warning(
+                "plan of a {:.1f}ms statement: {}\n{}", slow.duration * 1000, slow.statement, plan
+            )
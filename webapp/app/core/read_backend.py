@@ -0,0 +1,68 @@
+import time
+from enum import Enum
+from typing import Sequence
+
+from app.cdc.lag import cdc_lag, LagTracker
+from app.core.settings import settings
+
+__all__ = ["ReadBackend", "ReadBackendSelector", "read_backend"]
+
+
+class ReadBackend(str, Enum):
+    postgres = "postgres"
+    elasticsearch = "elasticsearch"
+    auto = "auto"
+
+
+class ReadBackendSelector:
+    def __init__(
+        self,
+        lags: Sequence[LagTracker],
+        *,
+        max_lag: float = settings.READ.MAX_LAG,
+        es_retry_after: float = settings.READ.ES_RETRY_AFTER,
+    ) -> None:
+        """
+        Pick the backend serving `auto` reads: Elasticsearch, unless the greatest CDC lag
+        of `lags` is over `max_lag` or it failed in the last `es_retry_after` seconds.
+        """
+        self.lags = lags
+        self.max_lag = max_lag
+        self.es_retry_after = es_retry_after
+
+        self._es_failed_at: float | None = None
+
+    @property
+    def lag(self) -> float | None:
+        """
+        Greatest known lag, `None` when none was measured recently.
+        """
+        known = [lag for lag in (tracker.lag for tracker in self.lags) if lag is not None]
+        return max(known, default=None)
+
+    def requested(self, backend: ReadBackend | None = None) -> ReadBackend:
+        return backend or ReadBackend(settings.READ.BACKEND)
+
+    def choose(self, backend: ReadBackend | None = None) -> ReadBackend:
+        backend = self.requested(backend)
+        if backend != ReadBackend.auto:
+            return backend
+        return ReadBackend.elasticsearch if self.es_usable() else ReadBackend.postgres
+
+    def es_usable(self) -> bool:
+        if (
+            self._es_failed_at is not None
+            and time.monotonic() - self._es_failed_at < self.es_retry_after
+        ):
+            return False
+
+        lag = self.lag
+        return lag is None or lag <= self.max_lag
+
+    def mark_es_failure(self) -> None:
+        self._es_failed_at = time.monotonic()
+
+
+# Not the heartbeat lag, it includes the refresh interval of the index (`ES.REFRESH_INTERVAL`)
+# and is over `READ.MAX_LAG` most of the time, it is for alerting
+read_backend = ReadBackendSelector([cdc_lag])
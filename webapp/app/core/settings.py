@@ -1,6 +1,6 @@
 from functools import cached_property, lru_cache
 from pathlib import Path
-from typing import Any, Tuple, Type
+from typing import Any, Literal, Tuple, Type
 
 from pydantic import BaseModel, computed_field, Field, PostgresDsn, ValidationInfo
 from pydantic.functional_validators import field_validator
@@ -27,6 +27,13 @@ class SQLAlchemySettings(BaseModel):
     MAX_OVERFLOW: int = 5
     POOL_TIMEOUT: int = 60
 
+    # Seconds a cached `count(*)` is served before being refreshed in the background
+    COUNT_CACHE_TTL: int = 60
+
+    # Lookups by id within this many seconds are coalesced into one query
+    BATCH_LOAD_WINDOW: float = 0.002
+    BATCH_LOAD_MAX_SIZE: int = 500
+
 
 class DbSettings(BaseModel):
     HOST: str = "postgres"
@@ -65,6 +72,18 @@ class DbSettings(BaseModel):
             else str(self.DATABASE_URI)
         )
 
+    # Read replicas, reads are spread round-robin over them when set
+    REPLICA_URIS: list[PostgresDsn] = []
+    # Send reads to the primary once the same session has written
+    PIN_PRIMARY_AFTER_WRITE: bool = True
+
+    @computed_field  # type: ignore[misc]
+    @cached_property
+    def ASYNC_REPLICA_URIS(self) -> list[str]:
+        return [
+            str(uri).replace("postgresql://", "postgresql+asyncpg://") for uri in self.REPLICA_URIS
+        ]
+
 
 class EsSettings(BaseModel):
     HOST: str = "es"
@@ -80,14 +99,134 @@ class EsSettings(BaseModel):
     MAX_RETRIES: int = 10
     CONNECTIONS_PER_NODE: int = 10
 
+    # Largest `from + size` of a search, deeper pages are read from Postgres
+    MAX_RESULT_WINDOW: int = 10_000
+
+    # Documents per request and point in time keep alive for full index reads
+    SCAN_BATCH_SIZE: int = 1_000
+    PIT_KEEP_ALIVE: str = "1m"
+
     NUMBER_OF_SHARDS: int = 1
     NUMBER_OF_ROUTING_SHARDS: int = 1
+    NUMBER_OF_REPLICAS: int = 0
+    REFRESH_INTERVAL: str = "30s"
+
+    # `python -m app.reindex`: id ranges read concurrently from Postgres, rows per read
+    # and bulk request, bulk requests sent concurrently
+    REINDEX_PARTITIONS: int = 4
+    REINDEX_BATCH_SIZE: int = 1_000
+    REINDEX_WRITERS: int = 4
+    # Seconds between two progress logs
+    REINDEX_PROGRESS_INTERVAL: float = 10
+    # Seconds of change events replayed before the watermark, the Kafka timestamps are set
+    # by other clocks. Events older than the watermark LSN are skipped, a wider margin
+    # only costs reading them
+    REINDEX_REPLAY_MARGIN: float = 300
+
+    # `python -m app.reconcile`: sub-ranges a differing id range is split into, size of
+    # the ranges whose ids are compared one by one, ranges compared concurrently
+    RECONCILE_FANOUT: int = 16
+    RECONCILE_LEAF_SIZE: int = 1_000
+    RECONCILE_CONCURRENCY: int = 4
 
     WATERMARK_LOW: str = "5gb"
     WATERMARK_HIGH: str = "2gb"
     WATERMARK_FLOOD_STAGE: str = "1gb"
 
 
+class ReadSettings(BaseModel):
+    # Backend of the list endpoints, `auto` uses Elasticsearch unless it lags or fails
+    BACKEND: Literal["postgres", "elasticsearch", "auto"] = "postgres"
+    # Seconds of change stream lag over which `auto` reads from Postgres, the refresh
+    # interval of the index is not part of it
+    MAX_LAG: float = 5
+    # A lag measured longer ago than this is unknown and does not trigger a fallback
+    LAG_STALE_AFTER: float = 60
+    # Seconds `auto` keeps reading from Postgres after an Elasticsearch error
+    ES_RETRY_AFTER: float = 30
+    # Seconds a read with a consistency token waits for the written documents to be
+    # searchable, and between two checks
+    CONSISTENCY_WAIT: float = 1
+    CONSISTENCY_POLL_INTERVAL: float = 0.1
+
+
+class CacheSettings(BaseModel):
+    ENABLED: bool = True
+
+    # `GET /item/{id}` results kept in process memory
+    ITEM_MAX_SIZE: int = 10_000
+    ITEM_TTL: float = 300
+
+    # Elasticsearch results by query body, cleared whenever the change stream reports
+    # a write, and again after the refresh making that write searchable
+    SEARCH_MAX_SIZE: int = 1_000
+    SEARCH_TTL: float = 30
+    # Seconds until a write is searchable, the refresh interval of the index
+    SEARCH_REFRESH_DELAY: float = 30
+
+
+class CdcSettings(BaseModel):
+    # Where the Debezium change events are read from, `none` disables the consumer
+    SOURCE: Literal["kafka", "file", "none"] = "kafka"
+    KAFKA_BOOTSTRAP_SERVERS: str = "kafka:29092"
+    TOPIC: str = "item"
+    # NDJSON file read when SOURCE is `file`
+    FILE_PATH: Path | None = None
+
+    # Seconds to wait before restarting a failed consumer, doubled up to the max
+    RESTART_BACKOFF: float = 1
+    RESTART_BACKOFF_MAX: float = 30
+
+    # Worker applying the events to Elasticsearch, run with `python -m app.cdc.apply`
+    APPLY_GROUP_ID: str = "item-es-apply"
+    # A bulk request is sent once it has that many actions or bytes, or once its first
+    # event waited that many seconds
+    APPLY_MAX_ACTIONS: int = 1_000
+    APPLY_MAX_BYTES: int = 5 * 1024 * 1024
+    APPLY_MAX_INTERVAL: float = 1
+    # Bulk requests sent concurrently and events read ahead of them
+    APPLY_MAX_IN_FLIGHT: int = 4
+    APPLY_QUEUE_SIZE: int = 10_000
+    APPLY_MAX_RETRIES: int = 5
+
+    # Heartbeat probes: a row of the `heartbeat` table is written every interval, its
+    # Debezium topic is indexed like the item topic, and the time until searches see it
+    # is the end-to-end lag. Rows of the same id are shared by the workers
+    HEARTBEAT_ENABLED: bool = True
+    HEARTBEAT_ID: int = 1
+    HEARTBEAT_TOPIC: str = "heartbeat"
+    HEARTBEAT_INDEX: str = "heartbeat"
+    HEARTBEAT_INTERVAL: float = 5
+    # Seconds between two searches for the row, and until a probe is given up
+    HEARTBEAT_POLL_INTERVAL: float = 0.2
+    HEARTBEAT_TIMEOUT: float = 120
+    # Last probes the lag percentiles are computed over
+    HEARTBEAT_WINDOW: int = 100
+
+
+class MetricsSettings(BaseModel):
+    # Time requests, repository calls, pool checkouts and Elasticsearch connections for
+    # `GET /metrics`. With several workers, set `PROMETHEUS_MULTIPROC_DIR` to an empty
+    # directory shared by them so that each scrape aggregates every worker
+    ENABLED: bool = True
+    # Seconds between two probes of the event loop lag
+    LOOP_LAG_INTERVAL: float = 0.5
+
+
+class ProfilingSettings(BaseModel):
+    # Count and time the statements, Elasticsearch requests and serialization of each
+    # request into a `Server-Timing` header, a cheap alternative to `SQLALCHEMY.ECHO`
+    ENABLED: bool = True
+    # Seconds over which a request is logged with its profile
+    SLOW_REQUEST: float = 1
+    # Share of the requests whose SELECTs slower than EXPLAIN_MIN_DURATION seconds are run
+    # again with `EXPLAIN (ANALYZE, BUFFERS)` once the response is sent and the plans
+    # logged, at most EXPLAIN_MAX_STATEMENTS of them, the slowest. 0 disables it
+    EXPLAIN_SAMPLE_RATE: float = 0
+    EXPLAIN_MIN_DURATION: float = 0.1
+    EXPLAIN_MAX_STATEMENTS: int = 3
+
+
 class Settings(BaseSettings):
     @classmethod
     def settings_customise_sources(  # type: ignore
@@ -109,6 +248,11 @@ class Settings(BaseSettings):
     SQLALCHEMY: SQLAlchemySettings = SQLAlchemySettings()
     DB: DbSettings
     ES: EsSettings = EsSettings()
+    READ: ReadSettings = ReadSettings()
+    CACHE: CacheSettings = CacheSettings()
+    CDC: CdcSettings = CdcSettings()
+    METRICS: MetricsSettings = MetricsSettings()
+    PROFILING: ProfilingSettings = ProfilingSettings()
 
 
 @lru_cache()
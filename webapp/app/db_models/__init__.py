@@ -1,2 +1,3 @@
 from .base import *
+from .heartbeat import *
 from .item import *
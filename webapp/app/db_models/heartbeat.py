@@ -0,0 +1,15 @@
+from __future__ import annotations
+
+from sqlalchemy import BigInteger
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base
+
+__all__ = ["Heartbeat"]
+
+
+class Heartbeat(Base):
+    # Written by the CDC lag monitor, replicated to its own index like the items
+    id: Mapped[int] = mapped_column(primary_key=True)
+    # Epoch milliseconds of the latest probe, never decreases
+    sent_at: Mapped[int] = mapped_column(BigInteger)
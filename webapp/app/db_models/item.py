@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+from sqlalchemy import text
 from sqlalchemy.orm import Mapped, mapped_column
 
 from .base import Base
@@ -11,3 +12,5 @@ class Item(Base):
     id: Mapped[int] = mapped_column(primary_key=True, index=True)
     title: Mapped[str | None] = mapped_column(index=True)
     description: Mapped[str | None] = mapped_column(index=True)
+    # Bumped by every update, replicated documents are compared against it
+    version: Mapped[int] = mapped_column(default=1, server_default=text("1"))
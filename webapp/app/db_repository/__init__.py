@@ -1 +1,3 @@
-from .item import item_db_repository
+from .base import CountStrategy
+from .heartbeat import heartbeat_db_repository
+from .item import invalidate_item_cache, item_db_cache, item_db_loader, item_db_repository
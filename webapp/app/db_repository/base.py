@@ -1,19 +1,78 @@
-from typing import Any, Generic, ParamSpec, Sequence, Type, TypeVar
+import asyncio
+import time
+from enum import Enum
+from typing import Any, AsyncIterator, Generic, ParamSpec, Sequence, Type, TypeVar
 
-from sqlalchemy import delete, func, update
+from loguru import logger
+from sqlalchemy import (
+    any_,
+    BigInteger,
+    bindparam,
+    cast,
+    column,
+    delete,
+    func,
+    insert,
+    literal,
+    text,
+    update,
+    values,
+)
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import Session
 from sqlalchemy.sql import Select
 
+from app.core.db_connection import async_db_connection
+from app.core.metrics import instrument_methods
+from app.core.settings import settings
 from app.db_models.base import Base
+from app.utils.checksum import ROW_HASH_MODULUS, ROW_HASH_MULTIPLIER
 
 ModelType = TypeVar("ModelType", bound=Base)
 Param = ParamSpec("Param")
 RetType = TypeVar("RetType")
 
 
+class CountStrategy(str, Enum):
+    # count(*) on every call
+    exact = "exact"
+    # planner estimate from pg_class.reltuples
+    estimate = "estimate"
+    # exact count cached for a TTL, refreshed in the background once stale
+    cached = "cached"
+
+
 class BaseDbRepository(Generic[ModelType]):
+    # `(method, histogram)` pairs, the calls of each method are timed into the histogram
+    metrics_histogram: list[tuple[str, str]] = [
+        (method, "db_call_duration_seconds")
+        for method in (
+            "create",
+            "creates_returning",
+            "copy_records",
+            "get_multi",
+            "get_multi_after",
+            "get_multi_rows",
+            "get_multi_versions_count",
+            "get_all",
+            "id_bounds",
+            "range_checksums",
+            "range_versions",
+            "get",
+            "get_version",
+            "get_many",
+            "count",
+            "count_estimate",
+            "delete_by_id",
+            "delete_by_ids",
+            "update",
+            "update_by_id",
+            "update_many_by_id",
+        )
+    ]
+
     def __init__(self, model: Type[ModelType]):
         """
         CRUD object with default methods to Create, Read, Update, Delete (CRUD).
@@ -22,6 +81,14 @@ class BaseDbRepository(Generic[ModelType]):
         * `schema`: A Pydantic model (schema) class
         """
         self.model = model
+        self._count_cache: tuple[int, float] | None = None
+        self._count_refresh: asyncio.Task | None = None
+
+        instrument_methods(
+            self,
+            self.metrics_histogram,
+            repository=self.model.__tablename__,  # type: ignore[attr-defined]
+        )
 
     ## Create
 
@@ -36,21 +103,195 @@ class BaseDbRepository(Generic[ModelType]):
             db.add(db_obj)
         await db.commit()
 
+    async def creates_returning(
+        self, db: AsyncSession, *, rows: Sequence[dict[str, Any]]
+    ) -> list[Any]:
+        """Insert rows with batched multi-row `INSERT ... RETURNING id` statements
+
+        Args:
+            db (AsyncSession): AsyncSession
+            rows (Sequence[dict[str, Any]]): column values of the rows to insert
+
+        Returns:
+            list[Any]: ids of the inserted rows, in input order
+        """
+        if not rows:
+            return []
+
+        q = await db.execute(
+            insert(self.model).returning(self.model.id, sort_by_parameter_order=True), list(rows)
+        )
+        ids = list(q.scalars().all())
+        await db.commit()
+        return ids
+
+    async def copy_records(
+        self, db: AsyncSession, *, rows: Sequence[dict[str, Any]], columns: Sequence[str]
+    ) -> int:
+        """Load rows with asyncpg binary `COPY ... FROM STDIN`
+
+        Columns not listed in `columns` (such as `id`) get their server-side default.
+
+        Args:
+            db (AsyncSession): AsyncSession
+            rows (Sequence[dict[str, Any]]): column values of the rows to insert
+            columns (Sequence[str]): columns to copy
+
+        Returns:
+            int: Number of copied rows
+        """
+        if not rows:
+            return 0
+
+        conn = await db.connection()
+        raw_conn = await conn.get_raw_connection()
+        assert raw_conn.driver_connection is not None, "connection is not established"
+
+        table = self.model.__table__
+        await raw_conn.driver_connection.copy_records_to_table(
+            table.name,  # type: ignore[attr-defined]
+            schema_name=table.schema,  # type: ignore[attr-defined]
+            columns=list(columns),
+            records=[tuple(row.get(column) for column in columns) for row in rows],
+        )
+        await db.commit()
+        return len(rows)
+
     ## Get multi
 
+    def filter_by(self, query: Select, where: dict[str, Any] | None) -> Select:
+        return query.filter_by(**where) if where else query
+
     async def get_multi(
-        self, db: AsyncSession, *, offset: int = 0, limit: int = 100
+        self,
+        db: AsyncSession,
+        *,
+        offset: int = 0,
+        limit: int = 100,
+        where: dict[str, Any] | None = None,
     ) -> Sequence[ModelType]:
         query = select(self.model).offset(offset).limit(limit).order_by(self.model.id)
+        q = await db.execute(self.filter_by(query, where))
+        return q.scalars().all()
+
+    async def get_multi_after(
+        self,
+        db: AsyncSession,
+        *,
+        after: Any | None = None,
+        limit: int = 100,
+        where: dict[str, Any] | None = None,
+    ) -> Sequence[ModelType]:
+        """Keyset pagination: rows with `id > after`, ordered by id
+
+        Unlike `get_multi`, the cost of a page does not grow with its depth.
+        """
+        query = self.filter_by(select(self.model).order_by(self.model.id).limit(limit), where)
+        if after is not None:
+            query = query.where(self.model.id > after)
         q = await db.execute(query)
         return q.scalars().all()
 
     async def get_multi_count(
-        self, db: AsyncSession, *, offset: int = 0, limit: int = 100
-    ) -> tuple[Sequence[ModelType], int]:
-        items = await self.get_multi(db, offset=offset, limit=limit)
-        total = await self.count_all(db)
-        return items, total
+        self,
+        db: AsyncSession,
+        *,
+        offset: int = 0,
+        limit: int = 100,
+        count_strategy: CountStrategy = CountStrategy.exact,
+        where: dict[str, Any] | None = None,
+    ) -> tuple[Sequence[ModelType], int, bool]:
+        items = await self.get_multi(db, offset=offset, limit=limit, where=where)
+        total, exact = await self._count_where(db, where, count_strategy)
+        return items, total, exact
+
+    async def get_multi_rows(
+        self,
+        db: AsyncSession,
+        *,
+        offset: int = 0,
+        limit: int = 100,
+        after: Any | None = None,
+        where: dict[str, Any] | None = None,
+        columns: Sequence[str] | None = None,
+    ) -> list[dict[str, Any]]:
+        """Same page as `get_multi` (or `get_multi_after` with `after`), as plain dicts
+
+        Core rows are read without building ORM instances or tracking them in the
+        identity map, for read-only responses.
+
+        Args:
+            db (AsyncSession): AsyncSession
+            after (Any | None): keyset pagination, only rows with `id > after`
+            columns (Sequence[str] | None): columns to read, all of them by default
+
+        Returns:
+            list[dict[str, Any]]: Column values by name, ordered by id
+        """
+        query = self.filter_by(
+            select(*self._columns(columns)).order_by(self.model.id).offset(offset).limit(limit),
+            where,
+        )
+        if after is not None:
+            query = query.where(self.model.id > after)
+        q = await db.execute(query)
+        keys = list(q.keys())
+        return [dict(zip(keys, row, strict=True)) for row in q.all()]
+
+    async def get_multi_rows_count(
+        self,
+        db: AsyncSession,
+        *,
+        offset: int = 0,
+        limit: int = 100,
+        count_strategy: CountStrategy = CountStrategy.exact,
+        where: dict[str, Any] | None = None,
+        columns: Sequence[str] | None = None,
+    ) -> tuple[list[dict[str, Any]], int, bool]:
+        """`get_multi_count` returning the rows of `get_multi_rows`"""
+        rows = await self.get_multi_rows(
+            db, offset=offset, limit=limit, where=where, columns=columns
+        )
+        total, exact = await self._count_where(db, where, count_strategy)
+        return rows, total, exact
+
+    def _columns(self, columns: Sequence[str] | None) -> list[Any]:
+        table = self.model.__table__
+        if columns is None:
+            return list(table.c)
+        return [table.c[name] for name in columns]
+
+    async def get_multi_versions_count(
+        self,
+        db: AsyncSession,
+        *,
+        offset: int = 0,
+        limit: int = 100,
+        count_strategy: CountStrategy = CountStrategy.exact,
+        where: dict[str, Any] | None = None,
+    ) -> tuple[list[tuple[Any, int]], int, bool]:
+        """Same page as `get_multi_count`, as `(id, version)` pairs instead of rows
+
+        Enough to tell whether a page changed without reading its rows.
+        """
+        query = (
+            select(self.model.id, self._version_column())
+            .offset(offset)
+            .limit(limit)
+            .order_by(self.model.id)
+        )
+        q = await db.execute(self.filter_by(query, where))
+        versions = [(row[0], row[1]) for row in q.all()]
+        total, exact = await self._count_where(db, where, count_strategy)
+        return versions, total, exact
+
+    async def _count_where(
+        self, db: AsyncSession, where: dict[str, Any] | None, count_strategy: CountStrategy
+    ) -> tuple[int, bool]:
+        if where:
+            # Estimates and cached counts are only kept for the whole table
+            return await self.count(db, self.filter_by(select(self.model), where)), True
+        return await self.count_all_with(db, strategy=count_strategy)
 
     ## Get all
 
@@ -59,12 +300,139 @@ class BaseDbRepository(Generic[ModelType]):
         q = await db.execute(query)
         return q.scalars().all()
 
+    async def stream_all(
+        self,
+        db: AsyncSession,
+        *,
+        after: Any | None = None,
+        until: Any | None = None,
+        yield_per: int = 1000,
+    ) -> AsyncIterator[ModelType]:
+        """Stream rows ordered by id through a server-side cursor
+
+        Rows are fetched `yield_per` at a time, so memory use does not grow with the table.
+
+        Args:
+            db (AsyncSession): AsyncSession, kept busy until the iteration ends
+            after (Any | None): only stream rows with `id > after`, to resume an export
+            until (Any | None): only stream rows with `id <= until`, to read an id range
+            yield_per (int): rows fetched per round trip
+        """
+        query = select(self.model).order_by(self.model.id).execution_options(yield_per=yield_per)
+        if after is not None:
+            query = query.where(self.model.id > after)
+        if until is not None:
+            query = query.where(self.model.id <= until)
+
+        result = await db.stream_scalars(query)
+        async for obj in result:
+            yield obj
+
+    async def stream_rows(
+        self,
+        db: AsyncSession,
+        *,
+        after: Any | None = None,
+        yield_per: int = 1000,
+        columns: Sequence[str] | None = None,
+    ) -> AsyncIterator[dict[str, Any]]:
+        """`stream_all` as the plain dicts of `get_multi_rows`
+
+        Args:
+            columns (Sequence[str] | None): columns to read, all of them by default
+        """
+        query = (
+            select(*self._columns(columns))
+            .order_by(self.model.id)
+            .execution_options(yield_per=yield_per)
+        )
+        if after is not None:
+            query = query.where(self.model.id > after)
+
+        result = await db.stream(query)
+        keys = list(result.keys())
+        async for row in result:
+            yield dict(zip(keys, row, strict=True))
+
+    ## Checksums
+
+    async def id_bounds(self, db: AsyncSession) -> tuple[int | None, int | None]:
+        """Smallest and greatest id, None for an empty table"""
+        q = await db.execute(select(func.min(self.model.id), func.max(self.model.id)))
+        min_id, max_id = q.one()
+        return min_id, max_id
+
+    async def range_checksums(
+        self, db: AsyncSession, *, start: int, stop: int, step: int
+    ) -> dict[int, tuple[int, int, int]]:
+        """`(count, sum(id), sum(row_hash(id, version)))` of the rows with `start <= id < stop`
+
+        Only the aggregates cross the wire, rows are never fetched. The content of the rows
+        is not part of it, a change that doesn't bump the version goes unnoticed.
+
+        Args:
+            db (AsyncSession): AsyncSession
+            start (int), stop (int): id range
+            step (int): ids per bucket, buckets start at `start`
+
+        Returns:
+            dict[int, tuple[int, int, int]]: Checksums of the non-empty buckets by first id
+        """
+        model_id = self.model.id
+        bucket = ((model_id - start) // step).label("bucket")
+        # `app.utils.checksum.row_hash` in SQL, on bigints like the Painless script
+        modulus = literal(ROW_HASH_MODULUS, BigInteger)
+        x = (
+            cast(model_id, BigInteger) % modulus * ROW_HASH_MULTIPLIER
+            + func.coalesce(self._version_column(), 0)
+        ) % modulus
+        query = (
+            select(bucket, func.count(), func.sum(model_id), func.sum(x * x % modulus))
+            .where(model_id >= start, model_id < stop)
+            .group_by(bucket)
+        )
+        q = await db.execute(query)
+        return {
+            start + int(row[0]) * step: (int(row[1]), int(row[2]), int(row[3] or 0))
+            for row in q.all()
+        }
+
+    async def range_versions(self, db: AsyncSession, *, start: int, stop: int) -> dict[int, int]:
+        """Version of each row with `start <= id < stop`"""
+        query = select(self.model.id, self._version_column()).where(
+            self.model.id >= start, self.model.id < stop
+        )
+        q = await db.execute(query)
+        return {int(row[0]): int(row[1]) for row in q.all()}
+
+    def _version_column(self) -> Any:
+        if "version" not in self.model.__table__.c:  # type: ignore[attr-defined]
+            return literal(0)
+        return self.model.version  # type: ignore[attr-defined]
+
     ## Get one
 
     async def get(self, db: AsyncSession, id: Any) -> ModelType | None:
         q = await db.execute(select(self.model).where(self.model.id == id))
         return q.scalars().one_or_none()
 
+    async def get_version(self, db: AsyncSession, id: Any) -> int | None:
+        """Version of a row without reading the row, None if it does not exist"""
+        return await db.scalar(select(self._version_column()).where(self.model.id == id))
+
+    async def get_many(self, db: AsyncSession, *, ids: Sequence[Any]) -> Sequence[ModelType]:
+        """Rows whose id is in `ids`, with a single `WHERE id = ANY($1)`"""
+        if not ids:
+            return []
+
+        id_type = self.model.__table__.c.id.type
+        q = await db.execute(
+            select(self.model).where(
+                self.model.id == any_(bindparam("ids", list(ids), type_=ARRAY(id_type)))
+            )
+        )
+        return q.scalars().all()
+
     def get_sync(self, db: Session, id: Any) -> ModelType | None:
         q = db.execute(select(self.model).where(self.model.id == id))
         return q.scalars().one_or_none()
@@ -90,6 +458,69 @@ class BaseDbRepository(Generic[ModelType]):
     async def count_all(self, db: AsyncSession) -> int:
         return await self.count(db=db, query=select(self.model))
 
+    async def count_all_with(
+        self, db: AsyncSession, *, strategy: CountStrategy
+    ) -> tuple[int, bool]:
+        """Counting of all rows with the given strategy
+
+        Args:
+            db (AsyncSession): AsyncSession
+            strategy (CountStrategy): how the total is obtained
+
+        Returns:
+            tuple[int, bool]: Number of rows and whether it is exact
+        """
+        if strategy == CountStrategy.estimate:
+            estimate = await self.count_estimate(db)
+            if estimate is not None:
+                return estimate, False
+        elif strategy == CountStrategy.cached:
+            return await self.count_cached(db)
+
+        return await self.count_all(db), True
+
+    async def count_estimate(self, db: AsyncSession) -> int | None:
+        """Planner estimate of the number of rows, None if the table was never analyzed"""
+        estimate = await db.scalar(
+            text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table)")
+            # Readable on a replica, doesn't pin the session to the primary
+            .execution_options(read_only=True),
+            {"table": self.model.__table__.fullname},  # type: ignore[attr-defined]
+        )
+        if estimate is None or estimate < 0:
+            return None
+        return int(estimate)
+
+    async def count_cached(
+        self, db: AsyncSession, *, ttl: float = settings.SQLALCHEMY.COUNT_CACHE_TTL
+    ) -> tuple[int, bool]:
+        """Exact count cached for `ttl` seconds
+
+        A stale value is still returned while it is refreshed in the background, so only
+        the very first call pays for the `count(*)`.
+
+        Returns:
+            tuple[int, bool]: Number of rows and whether it was counted within `ttl`
+        """
+        if self._count_cache is None:
+            total = await self.count_all(db)
+            self._count_cache = (total, time.monotonic())
+            return total, True
+
+        total, counted_at = self._count_cache
+        if time.monotonic() - counted_at < ttl:
+            return total, True
+
+        if self._count_refresh is None or self._count_refresh.done():
+            self._count_refresh = asyncio.create_task(self._refresh_count_cache())
+        return total, False
+
+    @logger.catch
+    async def _refresh_count_cache(self) -> None:
+        async with async_db_connection.session() as db:
+            total = await self.count_all(db)
+        self._count_cache = (total, time.monotonic())
+
     def count_sync(self, db: Session, query: Select) -> int:
         """Counting of results returned by the query
 
@@ -108,13 +539,52 @@ class BaseDbRepository(Generic[ModelType]):
 
     ## Delete
 
-    async def delete_by_id(self, db: AsyncSession, *, id: int) -> ModelType | None:
-        q = await db.execute(select(self.model).where(self.model.id == id))
-        obj = q.scalar_one()
-        await db.delete(obj)
+    async def delete_by_id(
+        self, db: AsyncSession, *, id: int, versions: Sequence[int] | None = None
+    ) -> ModelType | None:
+        """Delete a row with a single `DELETE ... RETURNING` round trip
+
+        Args:
+            versions (Sequence[int] | None): only delete the row while its version is one
+                of these, for optimistic concurrency
+
+        Returns:
+            ModelType | None: The deleted row, None if it did not exist or has another
+                version
+        """
+        query = (
+            delete(self.model)
+            .where(self.model.id == id)
+            .where(*([] if versions is None else [self._version_column().in_(versions)]))
+            .returning(self.model)
+            .execution_options(synchronize_session=False)
+        )
+        q = await db.execute(query)
+        obj = q.scalars().one_or_none()
         await db.commit()
         return obj
 
+    async def delete_by_ids(self, db: AsyncSession, *, ids: Sequence[Any]) -> list[Any]:
+        """Delete rows with a single `DELETE ... WHERE id = ANY($1) RETURNING id`
+
+        Returns:
+            list[Any]: ids of the deleted rows
+        """
+        if not ids:
+            return []
+
+        id_type = self.model.__table__.c.id.type
+        query = (
+            delete(self.model)
+            .where(self.model.id == any_(bindparam("ids", list(ids), type_=ARRAY(id_type))))
+            .returning(self.model.id)
+            .execution_options(synchronize_session=False)
+        )
+        q = await db.execute(query)
+        deleted = list(q.scalars().all())
+        await db.commit()
+        return deleted
+
     def delete_by_ids_sync(self, db: Session, ids: list[int]) -> None:
         query = delete(self.model).where(self.model.id.in_(list(ids)))
         db.execute(query)
@@ -130,6 +600,12 @@ class BaseDbRepository(Generic[ModelType]):
 
     ## Update
 
+    def with_version_bump(self, update_data: dict[str, Any]) -> dict[str, Any]:
+        """Add `version = version + 1` to the values of models with a `version` column"""
+        if "version" not in self.model.__table__.c:  # type: ignore[attr-defined]
+            return update_data
+        return {**update_data, "version": self.model.version + 1}  # type: ignore[attr-defined]
+
     async def update(
         self,
         db: AsyncSession,
@@ -137,8 +613,97 @@ class BaseDbRepository(Generic[ModelType]):
         db_obj: ModelType,
         update_data: dict[str, Any],
     ) -> ModelType:
-        query = update(self.model).where(self.model.id == db_obj.id).values(update_data)
+        query = (
+            update(self.model)
+            .where(self.model.id == db_obj.id)
+            .values(self.with_version_bump(update_data))
+        )
         await db.execute(query)
         await db.commit()
         await db.refresh(db_obj)
         return db_obj
+
+    async def update_by_id(
+        self,
+        db: AsyncSession,
+        *,
+        id: Any,
+        update_data: dict[str, Any],
+        versions: Sequence[int] | None = None,
+    ) -> ModelType | None:
+        """Update a row with a single `UPDATE ... RETURNING` round trip
+
+        Args:
+            versions (Sequence[int] | None): only update the row while its version is one
+                of these, for optimistic concurrency
+
+        Returns:
+            ModelType | None: The updated row, None if it does not exist or has another
+                version
+        """
+        if not update_data:
+            obj = await self.get(db, id)
+            if obj is None or versions is None or getattr(obj, "version", 0) in versions:
+                return obj
+            return None
+
+        query = (
+            update(self.model)
+            .where(self.model.id == id)
+            .where(*([] if versions is None else [self._version_column().in_(versions)]))
+            .values(self.with_version_bump(update_data))
+            .returning(self.model)
+            .execution_options(synchronize_session=False, populate_existing=True)
+        )
+        q = await db.execute(query)
+        obj = q.scalars().one_or_none()
+        await db.commit()
+        return obj
+
+    async def update_many_by_id(
+        self, db: AsyncSession, *, rows: Sequence[dict[str, Any]]
+    ) -> list[Any]:
+        """Update rows by id with per-row values using `UPDATE ... FROM (VALUES ...)`
+
+        Rows are grouped by the set of columns they update, one statement per group.
+        When an id appears more than once, its last row wins.
+
+        Args:
+            db (AsyncSession): AsyncSession
+            rows (Sequence[dict[str, Any]]): column values, each including the row `id`
+
+        Returns:
+            list[Any]: ids of the rows that exist
+        """
+        table = self.model.__table__
+        groups: dict[tuple[str, ...], list[dict[str, Any]]] = {}
+        for row in {row["id"]: row for row in rows}.values():
+            columns = tuple(sorted(name for name in row if name != "id"))
+            groups.setdefault(columns, []).append(row)
+
+        updated: list[Any] = []
+        for columns, group in groups.items():
+            if not columns:
+                # Nothing to set, only report which of these ids exist
+                q = await db.execute(
+                    select(self.model.id).where(self.model.id.in_([row["id"] for row in group]))
+                )
+                updated.extend(q.scalars().all())
+                continue
+
+            data = values(
+                *(column(name, table.c[name].type) for name in ("id", *columns)),
+                name="data",
+            ).data([tuple(row[name] for name in ("id", *columns)) for row in group])
+            query = (
+                update(self.model)
+                .where(self.model.id == data.c.id)
+                .values(self.with_version_bump({name: data.c[name] for name in columns}))
+                .returning(self.model.id)
+                .execution_options(synchronize_session=False)
+            )
+            q = await db.execute(query)
+            updated.extend(q.scalars().all())
+
+        await db.commit()
+        return updated
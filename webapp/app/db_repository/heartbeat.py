@@ -0,0 +1,37 @@
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db_models import Heartbeat
+
+from .base import BaseDbRepository
+
+
+class HeartbeatDbRepository(BaseDbRepository[Heartbeat]):
+    metrics_histogram = [
+        *BaseDbRepository.metrics_histogram,
+        ("beat", "db_call_duration_seconds"),
+    ]
+
+    async def beat(self, db: AsyncSession, *, id: int, sent_at: int) -> None:
+        """Upsert the heartbeat row and commit
+
+        `sent_at` is kept when the row already holds a later probe, so that the value seen
+        downstream only grows while several processes write the row.
+
+        Args:
+            db (AsyncSession): AsyncSession
+            id (int): id of the heartbeat row
+            sent_at (int): epoch milliseconds of the probe
+        """
+        statement = insert(Heartbeat).values(id=id, sent_at=sent_at)
+        await db.execute(
+            statement.on_conflict_do_update(
+                index_elements=[Heartbeat.id],
+                set_={"sent_at": func.greatest(Heartbeat.sent_at, statement.excluded.sent_at)},
+            )
+        )
+        await db.commit()
+
+
+heartbeat_db_repository = HeartbeatDbRepository(model=Heartbeat)
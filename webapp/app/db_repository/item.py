@@ -1,6 +1,10 @@
+from app.cdc import ChangeEvent
+from app.core.cache import LRUCache
+from app.core.settings import settings
 from app.db_models import Item
 
 from .base import BaseDbRepository
+from .loader import BatchLoader
 
 
 class ItemDbRepository(BaseDbRepository[Item]):
@@ -8,3 +12,13 @@ class ItemDbRepository(BaseDbRepository[Item]):
 
 
 item_db_repository = ItemDbRepository(model=Item)
+item_db_loader = BatchLoader(item_db_repository)
+item_db_cache: LRUCache[int, Item] = LRUCache(
+    max_size=settings.CACHE.ITEM_MAX_SIZE if settings.CACHE.ENABLED else 0,
+    ttl=settings.CACHE.ITEM_TTL,
+)
+
+
+def invalidate_item_cache(event: ChangeEvent) -> None:
+    if event.id is not None:
+        item_db_cache.invalidate(event.id)
@@ -0,0 +1,89 @@
+import asyncio
+from typing import Any, Generic, Sequence
+
+from app.core.db_connection import async_db_connection
+from app.core.settings import settings
+
+from .base import BaseDbRepository, ModelType
+
+__all__ = ["BatchLoader"]
+
+
+class BatchLoader(Generic[ModelType]):
+    def __init__(
+        self,
+        repository: BaseDbRepository[ModelType],
+        *,
+        window: float = settings.SQLALCHEMY.BATCH_LOAD_WINDOW,
+        max_batch_size: int = settings.SQLALCHEMY.BATCH_LOAD_MAX_SIZE,
+    ):
+        """
+        Per-process loader coalescing lookups by id in front of `BaseDbRepository.get`.
+        **Parameters**
+        * `repository`: repository whose `get_many` loads a batch
+        * `window`: seconds to wait for more ids before a batch is loaded
+        * `max_batch_size`: a batch is loaded right away once it has that many ids
+
+        Ids requested within the window are loaded with one `WHERE id = ANY(...)` query,
+        and concurrent requests for the same id share the same pending result.
+        """
+        self.repository = repository
+        self.window = window
+        self.max_batch_size = max_batch_size
+
+        self._pending: dict[Any, asyncio.Future[ModelType | None]] = {}
+        self._queue: list[Any] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._batches: set[asyncio.Task] = set()
+
+    async def load(self, id: Any) -> ModelType | None:
+        future = self._pending.get(id)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._pending[id] = loop.create_future()
+            self._queue.append(id)
+            if len(self._queue) >= self.max_batch_size:
+                self._dispatch()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.window, self._dispatch)
+
+        # A cancelled caller must not cancel the lookup shared with the others
+        return await asyncio.shield(future)
+
+    async def load_many(self, ids: Sequence[Any]) -> list[ModelType | None]:
+        return list(await asyncio.gather(*(self.load(id) for id in ids)))
+
+    def _dispatch(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        ids, self._queue = self._queue, []
+        if ids:
+            task = asyncio.create_task(self._load_batch(ids))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _load_batch(self, ids: list[Any]) -> None:
+        try:
+            async with async_db_connection.session() as db:
+                objs = await self.repository.get_many(db, ids=ids)
+        except Exception as e:
+            for id in ids:
+                self._resolve(id, error=e)
+            return
+
+        found = {obj.id: obj for obj in objs}
+        for id in ids:
+            self._resolve(id, result=found.get(id))
+
+    def _resolve(
+        self, id: Any, *, result: ModelType | None = None, error: Exception | None = None
+    ) -> None:
+        future = self._pending.pop(id, None)
+        if future is None or future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
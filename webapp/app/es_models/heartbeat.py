@@ -0,0 +1,32 @@
+from elasticsearch import AsyncElasticsearch
+
+from app.core.settings import settings
+from app.es_models.item import serving_profile
+
+__all__ = ["create_index_if_not_exists"]
+
+# Written from the heartbeat topic by the sink connector or the apply worker, both
+# versioning the documents with the offsets
+INDEX_NAME = settings.CDC.HEARTBEAT_INDEX
+
+mappings = {
+    "properties": {
+        "id": {"type": "long"},
+        "sent_at": {"type": "long"},
+    },
+}
+
+
+async def create_index_if_not_exists(es: AsyncElasticsearch) -> bool:
+    """
+    Create the heartbeat index with the refresh interval of the item index, so that a probe
+    becomes searchable as late as an item would.
+    """
+    if await es.indices.exists(index=INDEX_NAME):
+        return False
+    await es.indices.create(
+        index=INDEX_NAME,
+        mappings=mappings,
+        settings={"index": {"number_of_shards": 1, **serving_profile}},
+    )
+    return True
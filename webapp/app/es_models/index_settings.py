@@ -0,0 +1,90 @@
+import argparse
+import asyncio
+from contextlib import asynccontextmanager
+from enum import Enum
+from typing import Any, AsyncIterator
+
+from elasticsearch import AsyncElasticsearch
+from loguru import logger
+
+from app.core.custom_logging import make_customize_logger
+from app.core.es_connection import async_es_connection
+from app.core.settings import settings
+from app.es_models.item import bulk_profile, INDEX_NAME, serving_profile
+
+__all__ = ["IndexProfile", "apply_disk_watermarks", "apply_profile", "bulk_load"]
+
+
+class IndexProfile(str, Enum):
+    serving = "serving"
+    # Large writes: initial snapshots, backfills, reindexes
+    bulk = "bulk"
+
+
+_profiles: dict[IndexProfile, dict[str, Any]] = {
+    IndexProfile.serving: serving_profile,
+    IndexProfile.bulk: bulk_profile,
+}
+
+
+async def apply_profile(
+    es: AsyncElasticsearch, profile: IndexProfile, index: str = INDEX_NAME
+) -> None:
+    await es.indices.put_settings(index=index, settings={"index": _profiles[profile]})
+    logger.info("index {} switched to the {} profile", index, profile.value)
+
+
+@asynccontextmanager
+async def bulk_load(es: AsyncElasticsearch, index: str = INDEX_NAME) -> AsyncIterator[None]:
+    """
+    Bulk profile for the duration of the block, the serving profile is restored after it
+    and the loaded documents are refreshed.
+    """
+    await apply_profile(es, IndexProfile.bulk, index)
+    try:
+        yield
+    finally:
+        await apply_profile(es, IndexProfile.serving, index)
+        await es.indices.refresh(index=index)
+
+
+async def apply_disk_watermarks(es: AsyncElasticsearch) -> None:
+    watermarks: dict[str, Any] = {
+        "cluster.routing.allocation.disk.watermark.low": settings.ES.WATERMARK_LOW,
+        "cluster.routing.allocation.disk.watermark.high": settings.ES.WATERMARK_HIGH,
+        "cluster.routing.allocation.disk.watermark.flood_stage": settings.ES.WATERMARK_FLOOD_STAGE,
+    }
+    await es.cluster.put_settings(persistent=watermarks)
+    logger.info("disk watermarks set to {}", watermarks)
+
+
+async def run(args: argparse.Namespace) -> None:
+    async_es_connection.init()
+    try:
+        async with async_es_connection.session() as es:
+            if args.command == "watermarks":
+                await apply_disk_watermarks(es)
+            else:
+                await apply_profile(es, IndexProfile(args.command), args.index)
+    finally:
+        await async_es_connection.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Switch the index between the serving and bulk profiles, or apply the "
+        "disk watermarks. Switch to `bulk` before a Debezium snapshot, back to `serving` "
+        "once it is applied."
+    )
+    parser.add_argument(
+        "command", choices=[*(profile.value for profile in IndexProfile), "watermarks"]
+    )
+    parser.add_argument("--index", default=INDEX_NAME)
+    args = parser.parse_args()
+
+    make_customize_logger(settings.APP.CONFIG_DIR / "logging.json")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
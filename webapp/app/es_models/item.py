@@ -1,37 +1,125 @@
+from datetime import datetime, timezone
+from typing import Any
+
 from elasticsearch import AsyncElasticsearch
 
 from app.core.settings import settings
 
-__all__ = ["create_index", "exists_index", "create_index_if_not_exists"]
+__all__ = [
+    "bulk_profile",
+    "serving_profile",
+    "create_index",
+    "exists_index",
+    "create_index_if_not_exists",
+    "get_alias_indices",
+    "new_index_name",
+    "swap_alias",
+]
 
+# Alias in front of the versioned `item_<timestamp>` index, every read and write goes
+# through it so that `python -m app.reindex` can swap the index behind it
 INDEX_NAME = "item"
 
+# `title` and `description` are analyzed for full-text search, `.keyword` keeps exact
+# matches, sorting and aggregations, `.prefix` is edge-ngram indexed for search-as-you-type
+_text_field = {
+    "type": "text",
+    "fields": {
+        "keyword": {"type": "keyword", "ignore_above": 256},
+        "prefix": {
+            "type": "text",
+            "analyzer": "autocomplete",
+            "search_analyzer": "autocomplete_search",
+        },
+    },
+}
+
 mappings = {
     "properties": {
-        "id": {"type": "keyword", "index": True},
-        "title": {"type": "keyword", "index": True},
-        "description": {"type": "keyword", "index": True},
+        "id": {"type": "long"},
+        "title": _text_field,
+        "description": _text_field,
+        "version": {"type": "long"},
     },
 }
 
+analysis = {
+    "tokenizer": {
+        "autocomplete": {
+            "type": "edge_ngram",
+            "min_gram": 1,
+            "max_gram": 20,
+            "token_chars": ["letter", "digit"],
+        },
+    },
+    "analyzer": {
+        "autocomplete": {
+            "type": "custom",
+            "tokenizer": "autocomplete",
+            "filter": ["lowercase", "asciifolding"],
+        },
+        "autocomplete_search": {
+            "type": "custom",
+            "tokenizer": "standard",
+            "filter": ["lowercase", "asciifolding"],
+        },
+    },
+}
+
+
+# Dynamic index settings while the index serves searches, and while it is bulk loaded:
+# no refresh, no replica to copy every write to, translog fsynced in the background
+serving_profile: dict[str, Any] = {
+    "refresh_interval": settings.ES.REFRESH_INTERVAL,
+    "number_of_replicas": settings.ES.NUMBER_OF_REPLICAS,
+    "translog": {"durability": "request"},
+}
+bulk_profile: dict[str, Any] = {
+    "refresh_interval": "-1",
+    "number_of_replicas": 0,
+    "translog": {"durability": "async"},
+}
+
+
+def new_index_name() -> str:
+    return f"{INDEX_NAME}_{datetime.now(timezone.utc):%Y%m%d%H%M%S}"
+
+
+async def create_index(
+    es: AsyncElasticsearch,
+    index: str | None = None,
+    *,
+    profile: dict[str, Any] = serving_profile,
+) -> bool:
+    """
+    Create a versioned index with the item mappings.
+    **Parameters**
+    * `index`: name of the index, by default a new one is created behind the alias
+    * `profile`: dynamic settings, `bulk_profile` for an index about to be bulk loaded
+    """
+    aliases: dict[str, Any] = {}
+    if index is None:
+        index = new_index_name()
+        aliases = {INDEX_NAME: {"is_write_index": True}}
 
-async def create_index(es: AsyncElasticsearch) -> bool:
     await es.indices.create(
-        index=INDEX_NAME,
+        index=index,
+        aliases=aliases,
         mappings=mappings,
         settings={
             "index": {
                 "number_of_shards": settings.ES.NUMBER_OF_SHARDS,
                 "number_of_routing_shards": settings.ES.NUMBER_OF_ROUTING_SHARDS,
-                "number_of_replicas": 0,
-                "refresh_interval": "30s",
-            }
+                **profile,
+            },
+            "analysis": analysis,
         },
     )
     return True
 
 
 async def exists_index(es: AsyncElasticsearch) -> bool:
+    # True for the alias as well as for an `item` index created before it
     return bool(await es.indices.exists(index=INDEX_NAME))
 
 
@@ -39,3 +127,29 @@ async def create_index_if_not_exists(es: AsyncElasticsearch) -> bool:
     if not await exists_index(es):
         return await create_index(es)
     return True
+
+
+async def get_alias_indices(es: AsyncElasticsearch) -> list[str]:
+    if not await es.indices.exists_alias(name=INDEX_NAME):
+        return []
+    return list((await es.indices.get_alias(name=INDEX_NAME)).keys())
+
+
+async def swap_alias(es: AsyncElasticsearch, index: str) -> list[str]:
+    """
+    Atomically point the alias to `index` alone, return the indices it pointed to.
+
+    An `item` index created before the alias is deleted in the same request, the alias
+    takes its name.
+    """
+    previous = await get_alias_indices(es)
+    actions: list[dict[str, Any]] = []
+    if not previous and await es.indices.exists(index=INDEX_NAME):
+        actions.append({"remove_index": {"index": INDEX_NAME}})
+    actions.extend(
+        {"remove": {"index": old, "alias": INDEX_NAME}} for old in previous if old != index
+    )
+    actions.append({"add": {"index": index, "alias": INDEX_NAME, "is_write_index": True}})
+
+    await es.indices.update_aliases(actions=actions)
+    return [old for old in previous if old != index]
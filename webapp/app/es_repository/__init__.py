@@ -1 +1,2 @@
-from .item import item
+from .heartbeat import heartbeat
+from .item import invalidate_search_cache, item
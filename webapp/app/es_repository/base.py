@@ -1,11 +1,393 @@
-from typing import ParamSpec, TypeVar
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager, suppress
+from typing import Any, AsyncIterator, ParamSpec, Sequence, TypeVar
+
+from elasticsearch import AsyncElasticsearch, NotFoundError
+
+from app.core.cache import QueryResultCache
+from app.core.metrics import instrument_methods
+from app.core.settings import settings
+from app.utils.checksum import ROW_HASH_SCRIPT
 
 Param = ParamSpec("Param")
 RetType = TypeVar("RetType")
 
 
-class BaseESRepository:  # noqa: B903
-    metrics_histogram: list[tuple[str, str]] = []
+class BaseESRepository:
+    # `(method, histogram)` pairs, the calls of each method are timed into the histogram
+    metrics_histogram: list[tuple[str, str]] = [
+        (method, "es_call_duration_seconds")
+        for method in (
+            "get_multi_count",
+            "get_multi_after",
+            "stale_ids",
+            "id_bounds",
+            "range_checksums",
+            "range_versions",
+        )
+    ]
+    # Analyzed fields whose exact value is in the `.keyword` subfield
+    keyword_fields: set[str] = set()
 
-    def __init__(self, index_name: str) -> None:
+    def __init__(self, index_name: str, *, result_cache: QueryResultCache | None = None) -> None:
         self.index_name = index_name
+        self.result_cache = result_cache
+
+        instrument_methods(self, self.metrics_histogram, repository=index_name)
+
+    async def cached_search(
+        self, es: AsyncElasticsearch, *, cache: bool = True, **body: Any
+    ) -> dict[str, Any]:
+        """
+        Search the index, identical bodies are answered from `result_cache`.
+        **Parameters**
+        * `cache`: `False` bypasses the cache, the results are not stored either
+        """
+
+        async def search(_: str) -> dict[str, Any]:
+            return (await es.search(index=self.index_name, **body)).body
+
+        if not cache or self.result_cache is None:
+            return await search("")
+
+        key = json.dumps(body, sort_keys=True, separators=(",", ":"), default=str)
+        results = await self.result_cache.get_or_load(key, search)
+        assert results is not None
+        return results
+
+    def exact_field(self, field: str) -> str:
+        """
+        Field holding the exact values of `field`, for term queries and aggregations.
+        """
+        return f"{field}.keyword" if field in self.keyword_fields else field
+
+    def source_filter(self, fields: Sequence[str] | None) -> dict[str, Any]:
+        """
+        `_source` of a search returning only `fields`, the whole documents when `None`.
+        """
+        return {} if fields is None else {"source": list(fields)}
+
+    def term_filters(self, where: dict[str, Any] | None) -> list[dict[str, Any]]:
+        return [
+            {"term": {self.exact_field(field): value}} for field, value in (where or {}).items()
+        ]
+
+    async def get_multi_count(
+        self,
+        es: AsyncElasticsearch,
+        *,
+        offset: int = 0,
+        limit: int = 100,
+        exact: bool = True,
+        where: dict[str, Any] | None = None,
+        fields: Sequence[str] | None = None,
+        cache: bool = True,
+    ) -> tuple[list[dict[str, Any]], int, bool]:
+        """
+        Page of documents sorted by `id` with the number of matching documents.
+        **Parameters**
+        * `exact`: count every match, otherwise stop counting at 10,000
+        * `where`: exact values of fields
+        * `fields`: fields of the `_source` to return, all by default
+        * `cache`: `False` bypasses the result cache
+
+        Returns the `_source` of the documents, the total and whether it is exact.
+        """
+        results = await self.cached_search(
+            es,
+            cache=cache,
+            query={"bool": {"filter": self.term_filters(where)}},
+            sort=[{"id": "asc"}],
+            from_=offset,
+            size=limit,
+            track_total_hits=True if exact else 10_000,
+            **self.source_filter(fields),
+        )
+        total = results["hits"]["total"]
+        sources = [hit["_source"] for hit in results["hits"]["hits"]]
+        return sources, total["value"], total["relation"] == "eq"
+
+    async def get_multi_after(
+        self,
+        es: AsyncElasticsearch,
+        *,
+        after: Any | None = None,
+        limit: int = 100,
+        where: dict[str, Any] | None = None,
+        fields: Sequence[str] | None = None,
+        cache: bool = True,
+    ) -> list[dict[str, Any]]:
+        """
+        Keyset pagination, documents with `id > after` sorted by `id`.
+        """
+        results = await self.cached_search(
+            es,
+            cache=cache,
+            query={"bool": {"filter": self.term_filters(where)}},
+            sort=[{"id": "asc"}],
+            search_after=[after] if after is not None else None,
+            size=limit,
+            track_total_hits=False,
+            **self.source_filter(fields),
+        )
+        return [hit["_source"] for hit in results["hits"]["hits"]]
+
+    async def stale_ids(self, es: AsyncElasticsearch, versions: dict[Any, int | None]) -> set[Any]:
+        """
+        Ids whose searchable document is older than `versions`, `None` expects no document.
+        """
+        results = await es.search(
+            index=self.index_name,
+            query={"terms": {"id": list(versions)}},
+            source_includes=["id", "version"],
+            size=len(versions),
+            track_total_hits=False,
+        )
+        indexed = {
+            hit["_source"]["id"]: hit["_source"].get("version", 0)
+            for hit in results["hits"]["hits"]
+        }
+        return {
+            id
+            for id, version in versions.items()
+            if (id in indexed if version is None else indexed.get(id, -1) < version)
+        }
+
+    async def wait_for_versions(
+        self,
+        es: AsyncElasticsearch,
+        versions: dict[Any, int | None],
+        *,
+        timeout: float = settings.READ.CONSISTENCY_WAIT,
+        interval: float = settings.READ.CONSISTENCY_POLL_INTERVAL,
+    ) -> set[Any]:
+        """
+        Wait up to `timeout` seconds until searches see `versions` of the documents.
+
+        Returns the ids still stale when the time is up.
+        """
+        deadline = time.monotonic() + timeout
+        while versions:
+            stale = await self.stale_ids(es, versions)
+            remaining = deadline - time.monotonic()
+            if not stale or remaining <= 0:
+                return stale
+            versions = {id: versions[id] for id in stale}
+            await asyncio.sleep(min(interval, remaining))
+        return set()
+
+    async def id_bounds(self, es: AsyncElasticsearch) -> tuple[int | None, int | None]:
+        """
+        Smallest and greatest indexed id, `None` for an empty index.
+        """
+        results = await es.search(
+            index=self.index_name,
+            size=0,
+            aggs={"min_id": {"min": {"field": "id"}}, "max_id": {"max": {"field": "id"}}},
+        )
+        min_id, max_id = (results["aggregations"][name]["value"] for name in ("min_id", "max_id"))
+        return (
+            None if min_id is None else int(min_id),
+            None if max_id is None else int(max_id),
+        )
+
+    async def range_checksums(
+        self, es: AsyncElasticsearch, *, start: int, stop: int, step: int
+    ) -> dict[int, tuple[int, int, int]]:
+        """
+        `(count, sum(id), sum(row_hash(id, version)))` of the documents with
+        `start <= id < stop`, by bucket of `step` ids starting at `start`, keyed by the
+        first id of the bucket.
+
+        Sums are doubles in Elasticsearch, exact while they stay under 2^53.
+        """
+        results = await es.search(
+            index=self.index_name,
+            size=0,
+            query={"range": {"id": {"gte": start, "lt": stop}}},
+            aggs={
+                "buckets": {
+                    "histogram": {
+                        "field": "id",
+                        "interval": step,
+                        "offset": start % step,
+                        "min_doc_count": 1,
+                    },
+                    "aggs": {
+                        "sum_id": {"sum": {"field": "id"}},
+                        "sum_hash": {"sum": {"script": ROW_HASH_SCRIPT}},
+                    },
+                }
+            },
+        )
+        return {
+            int(bucket["key"]): (
+                bucket["doc_count"],
+                int(bucket["sum_id"]["value"]),
+                int(bucket["sum_hash"]["value"]),
+            )
+            for bucket in results["aggregations"]["buckets"]["buckets"]
+        }
+
+    async def range_versions(
+        self, es: AsyncElasticsearch, *, start: int, stop: int
+    ) -> dict[int, int]:
+        """
+        Version of each document with `start <= id < stop`, the range must fit in a page.
+        """
+        results = await es.search(
+            index=self.index_name,
+            query={"range": {"id": {"gte": start, "lt": stop}}},
+            source_includes=["id", "version"],
+            size=stop - start,
+            track_total_hits=False,
+        )
+        return {
+            hit["_source"]["id"]: hit["_source"].get("version", 0)
+            for hit in results["hits"]["hits"]
+        }
+
+    @asynccontextmanager
+    async def point_in_time(
+        self, es: AsyncElasticsearch, *, keep_alive: str = settings.ES.PIT_KEEP_ALIVE
+    ) -> AsyncIterator[dict[str, Any]]:
+        """
+        Open a point in time on the index, searches see a consistent snapshot.
+        The yielded `pit` is updated with the latest id returned by searches.
+        """
+        response = await es.open_point_in_time(index=self.index_name, keep_alive=keep_alive)
+        pit = {"id": response["id"], "keep_alive": keep_alive}
+        try:
+            yield pit
+        finally:
+            # Already gone if it expired
+            with suppress(NotFoundError):
+                await es.close_point_in_time(id=pit["id"])
+
+    async def iter_batches(
+        self,
+        es: AsyncElasticsearch,
+        *,
+        query: dict[str, Any] | None = None,
+        fields: Sequence[str] | None = None,
+        batch_size: int = settings.ES.SCAN_BATCH_SIZE,
+        slices: int = 1,
+        keep_alive: str = settings.ES.PIT_KEEP_ALIVE,
+    ) -> AsyncIterator[list[dict[str, Any]]]:
+        """
+        Read every matching document `_source` in batches of at most `batch_size`.
+        **Parameters**
+        * `query`: search query, all documents by default
+        * `fields`: fields of the `_source` to return, all by default
+        * `batch_size`: documents per search request
+        * `slices`: number of slices scanned in parallel, batches are then yielded in
+          no particular order
+        * `keep_alive`: how long the point in time is kept between two requests
+
+        Pages with a point in time and `search_after` on `_shard_doc`, so the whole
+        index is read without the `index.max_result_window` limit and only a few
+        batches are held in memory.
+        """
+        async with self.point_in_time(es, keep_alive=keep_alive) as pit:
+            if slices <= 1:
+                batches = self._search_after(
+                    es, pit, query=query, fields=fields, batch_size=batch_size
+                )
+            else:
+                batches = self._search_slices(
+                    es, pit, query=query, fields=fields, batch_size=batch_size, slices=slices
+                )
+            async for batch in batches:
+                yield batch
+
+    async def iter_all(
+        self,
+        es: AsyncElasticsearch,
+        **kwargs: Any,
+    ) -> AsyncIterator[dict[str, Any]]:
+        async for batch in self.iter_batches(es, **kwargs):
+            for source in batch:
+                yield source
+
+    async def _search_after(
+        self,
+        es: AsyncElasticsearch,
+        pit: dict[str, Any],
+        *,
+        query: dict[str, Any] | None,
+        fields: Sequence[str] | None,
+        batch_size: int,
+        slice: dict[str, int] | None = None,
+    ) -> AsyncIterator[list[dict[str, Any]]]:
+        search_after = None
+        while True:
+            response = await es.search(
+                pit=pit,
+                query=query or {"match_all": {}},
+                size=batch_size,
+                sort=[{"_shard_doc": "asc"}],
+                search_after=search_after,
+                slice=slice,
+                track_total_hits=False,
+                **self.source_filter(fields),
+            )
+            pit["id"] = response.get("pit_id", pit["id"])
+
+            hits = response["hits"]["hits"]
+            if hits:
+                yield [hit["_source"] for hit in hits]
+            if len(hits) < batch_size:
+                return
+            search_after = hits[-1]["sort"]
+
+    async def _search_slices(
+        self,
+        es: AsyncElasticsearch,
+        pit: dict[str, Any],
+        *,
+        slices: int,
+        **kwargs: Any,
+    ) -> AsyncIterator[list[dict[str, Any]]]:
+        # Bounded, a slow consumer holds the slices back instead of buffering the index
+        queue: asyncio.Queue[list[dict[str, Any]] | Exception | None] = asyncio.Queue(
+            maxsize=slices
+        )
+
+        tasks = [
+            asyncio.create_task(
+                self._scan_slice(es, pit, queue, slice={"id": id, "max": slices}, **kwargs)
+            )
+            for id in range(slices)
+        ]
+        try:
+            remaining = slices
+            while remaining:
+                batch = await queue.get()
+                if batch is None:
+                    remaining -= 1
+                elif isinstance(batch, Exception):
+                    raise batch
+                else:
+                    yield batch
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _scan_slice(
+        self,
+        es: AsyncElasticsearch,
+        pit: dict[str, Any],
+        queue: asyncio.Queue[list[dict[str, Any]] | Exception | None],
+        **kwargs: Any,
+    ) -> None:
+        try:
+            async for batch in self._search_after(es, pit, **kwargs):
+                await queue.put(batch)
+        except Exception as e:
+            await queue.put(e)
+        else:
+            # Marks the slice as done
+            await queue.put(None)
@@ -0,0 +1,29 @@
+from elasticsearch import AsyncElasticsearch
+
+from app.es_models.heartbeat import INDEX_NAME
+
+from .base import BaseESRepository
+
+
+class HeartbeatESRepository(BaseESRepository):
+    metrics_histogram = [
+        *BaseESRepository.metrics_histogram,
+        ("sent_at", "es_call_duration_seconds"),
+    ]
+
+    async def sent_at(self, es: AsyncElasticsearch, id: int) -> int | None:
+        """
+        `sent_at` of the heartbeat document as searches see it, `None` before it is indexed.
+        """
+        results = await es.search(
+            index=self.index_name,
+            query={"term": {"id": id}},
+            source_includes=["sent_at"],
+            size=1,
+            track_total_hits=False,
+        )
+        hits = results["hits"]["hits"]
+        return int(hits[0]["_source"]["sent_at"]) if hits else None
+
+
+heartbeat = HeartbeatESRepository(index_name=INDEX_NAME)
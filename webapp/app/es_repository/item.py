@@ -1,22 +1,197 @@
+from typing import Any, Sequence
+
 from elasticsearch import AsyncElasticsearch
 
+from app.cdc import ChangeEvent
+from app.core.cache import QueryResultCache
+from app.core.settings import settings
 from app.es_models.item import INDEX_NAME
-from app.schemas import Item
 
 from .base import BaseESRepository
 
+SEARCH_FIELDS = ["title^2", "description"]
+PREFIX_SEARCH_FIELDS = ["title.prefix^2", "description.prefix"]
+
 
 class ItemESRepository(BaseESRepository):
-    async def get_all(self, es: AsyncElasticsearch) -> list[Item]:
-        results = await es.search(
-            index=self.index_name,
-            query={"match_all": {}},
-            size=1000,
+    metrics_histogram = [
+        *BaseESRepository.metrics_histogram,
+        ("search", "es_call_duration_seconds"),
+        ("facets", "es_call_duration_seconds"),
+        ("facet_values", "es_call_duration_seconds"),
+    ]
+    keyword_fields = {"title", "description"}
+
+    def search_sort(self, q: str | None) -> list[dict[str, str]]:
+        # `id` breaks ties, so that `search_after` never skips or repeats a hit
+        if q:
+            return [{"_score": "desc"}, {"id": "asc"}]
+        return [{"id": "asc"}]
+
+    def search_query(
+        self, q: str | None, *, prefix: bool = False, filters: list[dict[str, Any]] | None = None
+    ) -> dict[str, Any]:
+        fields = PREFIX_SEARCH_FIELDS if prefix else SEARCH_FIELDS
+        must = (
+            [{"simple_query_string": {"query": q, "fields": fields, "default_operator": "and"}}]
+            if q
+            else [{"match_all": {}}]
+        )
+        return {"bool": {"must": must, "filter": filters or []}}
+
+    async def search(
+        self,
+        es: AsyncElasticsearch,
+        *,
+        q: str | None = None,
+        prefix: bool = False,
+        filters: list[dict[str, Any]] | None = None,
+        highlight: bool = True,
+        size: int = 50,
+        search_after: list[Any] | None = None,
+        fields: Sequence[str] | None = None,
+        cache: bool = True,
+    ) -> list[dict[str, Any]]:
+        """
+        Relevance-ranked search over `title` and `description`.
+        **Parameters**
+        * `q`: query in `simple_query_string` syntax, all items sorted by id if empty
+        * `prefix`: match the words of `q` as prefixes, for search-as-you-type
+        * `filters`: filter clauses, they don't change the score
+        * `highlight`: add the matching fragments to the hits
+        * `search_after`: `sort` values of the last hit of the previous page
+        * `fields`: fields of the `_source` to return, all by default
+        * `cache`: `False` bypasses the result cache
+        """
+        search_fields = PREFIX_SEARCH_FIELDS if prefix else SEARCH_FIELDS
+        body: dict[str, Any] = {}
+        if q and highlight:
+            body["highlight"] = {
+                "fields": {field.split("^")[0]: {} for field in search_fields},
+                "number_of_fragments": 3,
+            }
+
+        results = await self.cached_search(
+            es,
+            cache=cache,
+            query=self.search_query(q, prefix=prefix, filters=filters),
+            sort=self.search_sort(q),
+            search_after=search_after,
+            size=size,
+            track_total_hits=False,
+            **self.source_filter(fields),
+            **body,
+        )
+        return list(results["hits"]["hits"])
+
+    async def facets(
+        self,
+        es: AsyncElasticsearch,
+        *,
+        fields: list[str],
+        query: dict[str, Any] | None = None,
+        size: int = 10,
+        cardinality: bool = False,
+        histogram: tuple[str, float] | None = None,
+        cache: bool = True,
+    ) -> dict[str, Any]:
+        """
+        Counts of the most frequent values of `fields` among the matching items, computed
+        by aggregations in a single request that returns no document.
+        **Parameters**
+        * `size`: values counted per field
+        * `cardinality`: add the approximate number of distinct values of each field
+        * `histogram`: `(field, interval)` of a numeric field to count by interval
+
+        Returns the `total` of matches, the `facets` by field and the `histogram`.
+        """
+        aggs: dict[str, Any] = {}
+        for field in fields:
+            aggs[f"terms_{field}"] = {"terms": {"field": self.exact_field(field), "size": size}}
+            if cardinality:
+                # HyperLogLog++, exact below the precision threshold
+                aggs[f"cardinality_{field}"] = {
+                    "cardinality": {"field": self.exact_field(field), "precision_threshold": 3000}
+                }
+        if histogram is not None:
+            field, interval = histogram
+            aggs["histogram"] = {
+                "histogram": {"field": field, "interval": interval, "min_doc_count": 1}
+            }
+
+        results = await self.cached_search(
+            es, cache=cache, query=query, aggs=aggs, size=0, track_total_hits=True
         )
+        aggregations = results["aggregations"]
+        return {
+            "total": results["hits"]["total"]["value"],
+            "facets": {
+                field: {
+                    "buckets": _buckets(aggregations[f"terms_{field}"]),
+                    "other_count": aggregations[f"terms_{field}"]["sum_other_doc_count"],
+                    "cardinality": aggregations.get(f"cardinality_{field}", {}).get("value"),
+                }
+                for field in fields
+            },
+            "histogram": _buckets(aggregations["histogram"]) if histogram is not None else None,
+        }
+
+    async def facet_values(
+        self,
+        es: AsyncElasticsearch,
+        field: str,
+        *,
+        query: dict[str, Any] | None = None,
+        size: int = 100,
+        after: dict[str, Any] | None = None,
+        cache: bool = True,
+    ) -> tuple[list[dict[str, Any]], dict[str, Any] | None]:
+        """
+        Every value of `field` with its count, a page at a time in value order.
+        **Parameters**
+        * `after`: `after_key` returned with the previous page
 
-        return [result["_source"] for result in results["hits"]["hits"]]
+        Returns the page and the `after_key` of the next one, `None` after the last page.
+        """
+        composite: dict[str, Any] = {
+            "size": size,
+            "sources": [{"value": {"terms": {"field": self.exact_field(field)}}}],
+        }
+        if after is not None:
+            composite["after"] = after
+
+        results = await self.cached_search(
+            es,
+            cache=cache,
+            query=query,
+            aggs={"values": {"composite": composite}},
+            size=0,
+            track_total_hits=False,
+        )
+        values = results["aggregations"]["values"]
+        buckets = [
+            {"value": bucket["key"]["value"], "count": bucket["doc_count"]}
+            for bucket in values["buckets"]
+        ]
+        return buckets, values.get("after_key") if len(buckets) == size else None
 
 
 item = ItemESRepository(
     index_name=INDEX_NAME,
+    result_cache=QueryResultCache(
+        max_size=settings.CACHE.SEARCH_MAX_SIZE if settings.CACHE.ENABLED else 0,
+        ttl=settings.CACHE.SEARCH_TTL,
+        refresh_delay=settings.CACHE.SEARCH_REFRESH_DELAY,
+    ),
 )
+
+
+def _buckets(aggregation: dict[str, Any]) -> list[dict[str, Any]]:
+    return [
+        {"value": bucket["key"], "count": bucket["doc_count"]} for bucket in aggregation["buckets"]
+    ]
+
+
+def invalidate_search_cache(event: ChangeEvent) -> None:
+    if item.result_cache is not None:
+        item.result_cache.on_write()
@@ -5,11 +5,19 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from loguru import logger
 
+from app import db_repository, es_repository
+from app.cdc import cdc_lag, change_stream, create_event_source
+from app.cdc.heartbeat import create_heartbeat_source, heartbeat_monitor
 from app.core.custom_logging import make_customize_logger
 from app.core.db_connection import async_db_connection
 from app.core.es_connection import async_es_connection
+from app.core.metrics import loop_lag_monitor, mark_process_dead, MetricsMiddleware
+from app.core.profiling import ProfilingMiddleware
 from app.core.settings import settings
+from app.routers.cdc import router as cdc_router
 from app.routers.item import router as item_router
+from app.routers.metrics import router as metrics_router
+from app.utils import ProfiledORJSONResponse
 
 make_customize_logger(settings.APP.CONFIG_DIR / "logging.json")
 
@@ -20,10 +28,30 @@ async def lifespan(app: FastAPI) -> AsyncGenerator:
     async_db_connection.init()
     async_es_connection.init()
 
+    change_stream.subscribe(
+        db_repository.invalidate_item_cache, on_reset=db_repository.item_db_cache.clear
+    )
+    if es_repository.item.result_cache is not None:
+        change_stream.subscribe(
+            es_repository.invalidate_search_cache, on_reset=es_repository.item.result_cache.clear
+        )
+    change_stream.subscribe(cdc_lag.observe_event)
+    source = create_event_source()
+    if source is not None:
+        change_stream.start(source)
+    if settings.CDC.HEARTBEAT_ENABLED:
+        heartbeat_monitor.start(create_heartbeat_source())
+    if settings.METRICS.ENABLED:
+        loop_lag_monitor.start()
+
     yield
 
+    await loop_lag_monitor.stop()
+    await heartbeat_monitor.stop()
+    await change_stream.stop()
     await async_db_connection.close()
     await async_es_connection.close()
+    mark_process_dead()
 
     logger.info("FastAPI shutdown...")
 
@@ -31,6 +59,8 @@ async def lifespan(app: FastAPI) -> AsyncGenerator:
 app = FastAPI(
     redirect_slashes=True,
     lifespan=lifespan,
+    # Response models are serialized with orjson rather than the stdlib json encoder
+    default_response_class=ProfiledORJSONResponse,
 )
 
 app.add_middleware(  # type: ignore
@@ -41,4 +71,11 @@ app.add_middleware(  # type: ignore
     allow_headers=["*"],
 )
 
+if settings.METRICS.ENABLED:
+    app.add_middleware(MetricsMiddleware)  # type: ignore
+if settings.PROFILING.ENABLED:
+    app.add_middleware(ProfilingMiddleware)  # type: ignore
+
 app.include_router(item_router, prefix="/item")
+app.include_router(cdc_router, prefix="/cdc")
+app.include_router(metrics_router)
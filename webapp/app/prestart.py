@@ -10,6 +10,7 @@ from tenacity.wait import wait_fixed
 from app.core.custom_logging import make_customize_logger
 from app.core.es_connection import async_es_connection
 from app.core.settings import settings
+from app.es_models.index_settings import apply_disk_watermarks
 from app.es_models.item import create_index_if_not_exists
 
 max_tries = 60 * 5  # 5 minutes
@@ -29,6 +30,7 @@ async def init() -> None:
     async_es_connection.init(connections_per_node=settings.ES.CONNECTIONS_PER_NODE)
 
     async with async_es_connection.session() as es:
+        await apply_disk_watermarks(es=es)
         await create_index_if_not_exists(es=es)
 
     await async_es_connection.close()
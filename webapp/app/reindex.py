@@ -0,0 +1,274 @@
+import argparse
+import asyncio
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+
+from elasticsearch import AsyncElasticsearch
+from loguru import logger
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import schemas
+from app.cdc.apply import BulkApplyWorker
+from app.cdc.sources import create_replay_source, MemoryEventSource
+from app.core.custom_logging import make_customize_logger
+from app.core.db_connection import async_db_connection
+from app.core.es_connection import async_es_connection
+from app.core.settings import settings
+from app.db_models import Item
+from app.db_repository import item_db_repository
+from app.es_models.index_settings import bulk_load
+from app.es_models.item import bulk_profile, create_index, new_index_name, swap_alias
+
+__all__ = ["Reindexer", "Watermark"]
+
+# Seconds between two checks of the transactions running at the watermark
+_TRANSACTIONS_POLL_INTERVAL = 0.1
+
+
+@dataclass
+class Watermark:
+    # Epoch milliseconds, WAL position and id range when the load started, every
+    # transaction that wrote before the WAL position was committed or rolled back
+    timestamp: int
+    lsn: int
+    min_id: int | None
+    max_id: int | None
+
+
+class Reindexer:
+    def __init__(
+        self,
+        *,
+        partitions: int = settings.ES.REINDEX_PARTITIONS,
+        batch_size: int = settings.ES.REINDEX_BATCH_SIZE,
+        writers: int = settings.ES.REINDEX_WRITERS,
+        progress_interval: float = settings.ES.REINDEX_PROGRESS_INTERVAL,
+        replay_margin: float = settings.ES.REINDEX_REPLAY_MARGIN,
+    ):
+        """
+        Rebuild the item index from Postgres into a new index and swap the alias to it.
+        **Parameters**
+        * `partitions`: id ranges read concurrently, each with its own connection
+        * `batch_size`: rows per fetch and documents per bulk request
+        * `writers`: bulk requests sent concurrently
+        * `progress_interval`: seconds between two progress logs
+        * `replay_margin`: seconds of change events replayed before the watermark
+
+        The new index is in the bulk profile during the load. The rows changed meanwhile are
+        caught up by replaying the change events since the watermark, once before the
+        swap and once after it for the events still applied to the previous index. With
+        `CDC.SOURCE` set to `none` only the rows inserted after the watermark are caught up.
+
+        The watermark is a WAL position taken once every transaction running at it ended,
+        so the backfill reads every change written before it. The replay starts
+        `replay_margin` before the watermark by Kafka timestamps and skips the events whose
+        `__lsn` is before the watermark, the clocks of Kafka and Postgres only need to be
+        closer than the margin.
+
+        Replayed events are versioned with their Kafka offsets, like the writes of the sink
+        connector, so the sink keeps writing the new index after the swap. Backfilled rows
+        get the version 0, which every event overrides.
+        """
+        self.partitions = partitions
+        self.batch_size = batch_size
+        self.writers = writers
+        self.progress_interval = progress_interval
+        self.replay_margin = replay_margin
+
+    async def run(self, es: AsyncElasticsearch, *, delete_previous: bool = False) -> str:
+        """
+        Reindex, return the name of the new index.
+        """
+        index = new_index_name()
+        await create_index(es, index, profile=bulk_profile)
+        logger.info("reindexing into {}", index)
+
+        watermark = await self._watermark()
+        logger.info("watermark {}", watermark)
+        async with bulk_load(es, index):
+            await self._backfill(es, index, watermark)
+
+        caught_up_at = _now_ms()
+        await self._catch_up(es, index, watermark, since=watermark.timestamp)
+        previous = await swap_alias(es, index)
+        logger.info("alias swapped from {} to {}", previous, index)
+        await self._catch_up(es, index, watermark, since=caught_up_at)
+
+        if delete_previous and previous:
+            await es.indices.delete(index=",".join(previous))
+            logger.info("deleted {}", previous)
+        return index
+
+    async def _watermark(self) -> Watermark:
+        timestamp = _now_ms()
+        async with async_db_connection.session() as db:
+            lsn, xmax = (
+                await db.execute(
+                    text(
+                        "SELECT pg_current_wal_lsn() - '0/0'::pg_lsn, "
+                        "pg_snapshot_xmax(pg_current_snapshot())::text::bigint"
+                    )
+                )
+            ).one()
+            # A transaction running now may have written before `lsn` and commit after
+            # the backfill read its rows, its events would be skipped by the replay
+            await self._wait_for_transactions(db, before=xmax)
+            min_id, max_id = (await db.execute(select(func.min(Item.id), func.max(Item.id)))).one()
+        return Watermark(timestamp=timestamp, lsn=int(lsn), min_id=min_id, max_id=max_id)
+
+    async def _wait_for_transactions(self, db: AsyncSession, *, before: int) -> None:
+        """
+        Wait until the transactions with an id lower than `before` have all ended.
+        """
+        query = text("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint")
+        while await db.scalar(query) < before:
+            await asyncio.sleep(_TRANSACTIONS_POLL_INTERVAL)
+
+    def _ranges(self, watermark: Watermark) -> list[tuple[int | None, int | None]]:
+        """
+        `(after, until]` id ranges splitting the ids of the watermark, the last one is open
+        so that the rows inserted during the load are read as well.
+        """
+        if watermark.min_id is None or watermark.max_id is None:
+            return [(None, None)]
+
+        start = watermark.min_id - 1
+        span = watermark.max_id - start
+        bounds = [start + span * i // self.partitions for i in range(self.partitions + 1)]
+        ranges: list[tuple[int | None, int | None]] = [
+            (after, until)
+            for after, until in zip(bounds, bounds[1:], strict=False)
+            if after < until
+        ]
+        ranges[-1] = (ranges[-1][0], None)
+        return ranges
+
+    async def _backfill(self, es: AsyncElasticsearch, index: str, watermark: Watermark) -> None:
+        async with async_db_connection.session() as db:
+            total = await item_db_repository.count_estimate(db)
+
+        await self._load(es, index, self._ranges(watermark), total=total)
+
+    async def _load(
+        self,
+        es: AsyncElasticsearch,
+        index: str,
+        ranges: list[tuple[int | None, int | None]],
+        *,
+        total: int | None,
+    ) -> None:
+        source = MemoryEventSource(maxsize=self.batch_size * self.writers * 2)
+        worker = BulkApplyWorker(
+            source,
+            index_name=index,
+            max_actions=self.batch_size,
+            max_in_flight=self.writers,
+            backfill=True,
+        )
+        applying = asyncio.create_task(worker.run(es))
+        reading = asyncio.create_task(self._read_all(source, ranges))
+        progress = asyncio.create_task(self._report(worker, total))
+        tasks = [applying, reading, progress]
+        try:
+            # A failed worker stops reading, the readers would wait on the full source
+            await asyncio.wait({applying, reading}, return_when=asyncio.FIRST_COMPLETED)
+            if applying.done():
+                applying.result()
+            await reading
+            # And so would the end of the source
+            closing = asyncio.create_task(source.close())
+            tasks.append(closing)
+            await asyncio.wait({applying, closing}, return_when=asyncio.FIRST_COMPLETED)
+            await applying
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        logger.info("loaded {}", worker.stats)
+
+    async def _read_all(
+        self, source: MemoryEventSource, ranges: list[tuple[int | None, int | None]]
+    ) -> None:
+        await asyncio.gather(*(self._read(source, after, until) for after, until in ranges))
+
+    async def _read(self, source: MemoryEventSource, after: int | None, until: int | None) -> None:
+        async with async_db_connection.session() as db:
+            rows = item_db_repository.stream_all(
+                db, after=after, until=until, yield_per=self.batch_size
+            )
+            async for row in rows:
+                await source.put(row.id, schemas.Item.model_validate(row).model_dump())
+
+    async def _report(self, worker: BulkApplyWorker, total: int | None) -> None:
+        started = time.perf_counter()
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            done = worker.stats.indexed
+            rate = done / (time.perf_counter() - started)
+            eta = (
+                timedelta(seconds=round((total - done) / rate))
+                if total is not None and rate and total > done
+                else None
+            )
+            logger.info(
+                "reindexed {}/{} docs, {:.0f} docs/s, ETA {}", done, total or "?", rate, eta
+            )
+
+    async def _catch_up(
+        self, es: AsyncElasticsearch, index: str, watermark: Watermark, *, since: int
+    ) -> None:
+        source = create_replay_source(since - int(self.replay_margin * 1000))
+        if source is None:
+            logger.warning(
+                "no change events to replay, only the ids after {} are caught up, run the "
+                "reindex while nothing is updated or deleted",
+                watermark.max_id,
+            )
+            await self._load(es, index, [(watermark.max_id, None)], total=None)
+            return
+
+        worker = BulkApplyWorker(
+            source, index_name=index, max_in_flight=self.writers, min_lsn=watermark.lsn
+        )
+        await worker.run(es)
+        logger.info("caught up from lsn {}, {}", watermark.lsn, worker.stats)
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+async def run(args: argparse.Namespace) -> None:
+    async_db_connection.init()
+    async_es_connection.init()
+    try:
+        reindexer = Reindexer(
+            partitions=args.partitions, batch_size=args.batch_size, writers=args.writers
+        )
+        async with async_es_connection.session() as es:
+            await reindexer.run(es, delete_previous=args.delete_previous)
+    finally:
+        await async_es_connection.close()
+        await async_db_connection.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Rebuild the item index from Postgres and swap the alias to it"
+    )
+    parser.add_argument("--partitions", type=int, default=settings.ES.REINDEX_PARTITIONS)
+    parser.add_argument("--batch-size", type=int, default=settings.ES.REINDEX_BATCH_SIZE)
+    parser.add_argument("--writers", type=int, default=settings.ES.REINDEX_WRITERS)
+    parser.add_argument(
+        "--delete-previous", action="store_true", help="delete the index the alias pointed to"
+    )
+    args = parser.parse_args()
+
+    make_customize_logger(settings.APP.CONFIG_DIR / "logging.json")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
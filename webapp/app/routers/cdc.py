@@ -0,0 +1,28 @@
+from fastapi import APIRouter
+
+from app import schemas
+from app.cdc import cdc_lag, heartbeat_lag
+from app.cdc.heartbeat import heartbeat_monitor, PERCENTILES
+from app.core.read_backend import read_backend
+
+router = APIRouter()
+
+
+@router.get("/lag", response_model=schemas.CdcLag)
+async def read_lag() -> schemas.CdcLag:
+    """
+    How far Elasticsearch is behind Postgres, and the heartbeat latency percentiles.
+    """
+    return schemas.CdcLag(
+        lag=read_backend.lag,
+        change_stream_lag=cdc_lag.lag,
+        heartbeat_lag=heartbeat_lag.lag,
+        es_usable=read_backend.es_usable(),
+        stages={
+            stage: schemas.LatencyPercentiles(
+                count=window.count,
+                **{f"p{percent}": window.percentile(percent) for percent in PERCENTILES},
+            )
+            for stage, window in heartbeat_monitor.windows.items()
+        },
+    )
@@ -1,25 +1,79 @@
-from typing import Annotated, Any
+import asyncio
+import csv
+import io
+import time
+from typing import Annotated, Any, AsyncIterator, Awaitable, Callable, Literal, Sequence, TypeVar
 
-from elasticsearch import AsyncElasticsearch
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi_pagination.api import create_page, resolve_params
-from fastapi_pagination.default import Page, Params
+import orjson
+from asyncpg import PostgresError
+from elasticsearch import ApiError, AsyncElasticsearch, TransportError
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from fastapi_pagination.api import resolve_params
+from fastapi_pagination.default import Params
+from loguru import logger
+from pydantic import BaseModel, ValidationError
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import db_models, db_repository, es_repository, schemas
+from app.cdc import change_stream
+from app.core.cache import LRUCache
+from app.core.db_connection import async_db_connection, use_primary
+from app.core.es_connection import async_es_connection
+from app.core.read_backend import read_backend, ReadBackend
+from app.core.settings import settings
 from app.deps import get_async_db, get_async_es
-from app.utils import get_limit_offset, get_params
+from app.utils import (
+    chunked,
+    CONSISTENCY_TOKEN_HEADER,
+    ConsistencyToken,
+    create_cursor_page,
+    CursorPage,
+    CursorParams,
+    decode_cursor,
+    encode_consistency_token,
+    encode_cursor,
+    etag_matches,
+    etag_versions,
+    get_consistency_token,
+    get_cursor_params,
+    get_limit_offset,
+    get_params,
+    iter_json_records,
+    make_etag,
+    merge_consistency_tokens,
+    model_response,
+    narrowed_model,
+    Page,
+    project,
+    sparse_fields,
+    trusted_response,
+    version_etag,
+)
 
 router = APIRouter()
 
+T = TypeVar("T")
+
 Db = Annotated[AsyncSession, Depends(get_async_db)]
 Es = Annotated[AsyncElasticsearch, Depends(get_async_es)]
+Token = Annotated[ConsistencyToken, Depends(get_consistency_token)]
+IfNoneMatch = Annotated[
+    str | None, Header(description="ETag of the cached response, 304 if it is still current")
+]
+IfMatch = Annotated[str | None, Header(description="ETag of the item, 412 if it was updated since")]
+# Columns read for `schemas.Item` responses
+ITEM_COLUMNS = list(schemas.Item.model_fields)
+NOT_MODIFIED: dict[int | str, dict[str, Any]] = {304: {"description": "Not modified"}}
 
 
 @router.post("/", response_model=schemas.Item)
 async def create_item(
     *,
     db: Db,
+    response: Response,
+    token: Token,
     item_in: schemas.ItemCreate,
 ) -> Any:
     """
@@ -29,87 +83,837 @@ async def create_item(
     obj_in_data = item_in.model_dump(exclude_unset=True)
     db_obj = db_models.Item(**obj_in_data)  # type: ignore
     item = await db_repository.item_db_repository.create(db=db, db_obj=db_obj)
+    _set_consistency_token(response, token, {item.id: item.version})
+    response.headers["ETag"] = version_etag(item.version)
     return item
 
 
-@router.get("/", response_model=Page[schemas.Item])
+def _set_consistency_token(
+    response: Response, token: ConsistencyToken, written: ConsistencyToken
+) -> None:
+    # Merged with the token of the request, so that it covers the writes of a session
+    token = merge_consistency_tokens(token, written)
+    response.headers[CONSISTENCY_TOKEN_HEADER] = encode_consistency_token(token)
+
+
+@router.post(
+    "/bulk",
+    response_model=schemas.BulkIngestResult,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {"schema": {"type": "array", "items": {"type": "object"}}},
+                "application/x-ndjson": {"schema": {"type": "string"}},
+            },
+        }
+    },
+)
+async def create_items_bulk(
+    *,
+    db: Db,
+    request: Request,
+    method: Annotated[
+        Literal["copy", "insert"],
+        Query(description="`copy` uses binary COPY, `insert` returns the created ids"),
+    ] = "copy",
+    chunk_size: Annotated[int, Query(ge=1, le=50_000, description="Rows per chunk")] = 5_000,
+) -> Any:
+    """
+    Bulk create items from a streamed JSON-array or NDJSON body.
+    """
+    result = schemas.BulkIngestResult()
+    started = time.perf_counter()
+
+    async def records() -> AsyncIterator[Any]:
+        # Stop at the first malformed record but still load the rows read before it.
+        try:
+            async for record in iter_json_records(request.stream()):
+                yield record
+        except ValueError as e:
+            result.error = f"invalid request body: {e}"
+
+    async for chunk in chunked(records(), chunk_size):
+        chunk_result = await _ingest_chunk(
+            db, chunk, chunk=len(result.chunks), offset=result.received, method=method
+        )
+        result.chunks.append(chunk_result)
+        result.received += chunk_result.received
+        result.inserted += chunk_result.inserted
+        logger.info(
+            "bulk ingest chunk {} received={} inserted={} errors={} elapsed={:.3f}s",
+            chunk_result.chunk,
+            chunk_result.received,
+            chunk_result.inserted,
+            len(chunk_result.errors),
+            chunk_result.elapsed,
+        )
+
+    result.failed = result.received - result.inserted
+    result.elapsed = time.perf_counter() - started
+    result.rows_per_second = result.inserted / result.elapsed if result.elapsed else 0
+    return result
+
+
+async def _ingest_chunk(
+    db: AsyncSession,
+    records: list[Any],
+    *,
+    chunk: int,
+    offset: int,
+    method: Literal["copy", "insert"],
+) -> schemas.BulkChunkResult:
+    started = time.perf_counter()
+    errors: list[schemas.BulkRecordError] = []
+    rows: list[dict[str, Any]] = []
+
+    for index, record in enumerate(records, start=offset):
+        try:
+            rows.append(schemas.ItemCreate.model_validate(record).model_dump())
+        except ValidationError as e:
+            errors.append(schemas.BulkRecordError(index=index, detail=str(e)))
+
+    ids: list[int] | None = None
+    inserted = 0
+    try:
+        if method == "copy":
+            columns = list(schemas.ItemCreate.model_fields)
+            inserted = await db_repository.item_db_repository.copy_records(
+                db, rows=rows, columns=columns
+            )
+        else:
+            ids = await db_repository.item_db_repository.creates_returning(db, rows=rows)
+            inserted = len(ids)
+    except (DBAPIError, PostgresError) as e:
+        await db.rollback()
+        errors.append(schemas.BulkRecordError(index=None, detail=str(e)))
+
+    return schemas.BulkChunkResult(
+        chunk=chunk,
+        offset=offset,
+        received=len(records),
+        inserted=inserted,
+        ids=ids,
+        errors=errors,
+        elapsed=time.perf_counter() - started,
+    )
+
+
+@router.patch("/bulk", response_model=schemas.BulkWriteResult)
+async def update_items_bulk(
+    *,
+    db: Db,
+    items_in: list[schemas.ItemBulkUpdate],
+    chunk_size: Annotated[int, Query(ge=1, le=5_000, description="Rows per statement")] = 1_000,
+) -> Any:
+    """
+    Update many items by id, each with its own values.
+    """
+    # The last update of an id wins
+    rows = list(
+        {item_in.id: item_in.model_dump(exclude_unset=True) for item_in in items_in}.values()
+    )
+
+    async def write(chunk: list[dict[str, Any]]) -> list[Any]:
+        ids = await db_repository.item_db_repository.update_many_by_id(db, rows=chunk)
+        _invalidate_items(ids)
+        return ids
+
+    return await _bulk_write(db, rows, write, status="updated", chunk_size=chunk_size)
+
+
+@router.delete("/bulk", response_model=schemas.BulkWriteResult)
+async def delete_items_bulk(
+    *,
+    db: Db,
+    ids_in: schemas.ItemBulkDelete,
+    chunk_size: Annotated[int, Query(ge=1, le=50_000, description="Ids per statement")] = 5_000,
+) -> Any:
+    """
+    Delete many items by id.
+    """
+
+    async def write(chunk: list[dict[str, Any]]) -> list[Any]:
+        ids = [row["id"] for row in chunk]
+        deleted = await db_repository.item_db_repository.delete_by_ids(db, ids=ids)
+        _invalidate_items(deleted)
+        return deleted
+
+    rows = [{"id": id} for id in dict.fromkeys(ids_in.ids)]
+    return await _bulk_write(db, rows, write, status="deleted", chunk_size=chunk_size)
+
+
+async def _bulk_write(
+    db: AsyncSession,
+    rows: Sequence[dict[str, Any]],
+    write: Callable[[list[dict[str, Any]]], Awaitable[list[Any]]],
+    *,
+    status: Literal["updated", "deleted"],
+    chunk_size: int,
+) -> schemas.BulkWriteResult:
+    result = schemas.BulkWriteResult()
+
+    for start in range(0, len(rows), chunk_size):
+        chunk = list(rows[start : start + chunk_size])
+        try:
+            done = set(await write(chunk))
+        except DBAPIError as e:
+            await db.rollback()
+            result.failed += len(chunk)
+            result.results.extend(
+                schemas.BulkItemStatus(id=row["id"], status="failed", detail=str(e.orig))
+                for row in chunk
+            )
+            continue
+
+        for row in chunk:
+            if row["id"] in done:
+                result.succeeded += 1
+                result.results.append(schemas.BulkItemStatus(id=row["id"], status=status))
+            else:
+                result.not_found += 1
+                result.results.append(schemas.BulkItemStatus(id=row["id"], status="not_found"))
+
+    return result
+
+
+def _invalidate_items(ids: Sequence[int]) -> None:
+    # Change events will do it too, this only saves this process from serving
+    # its own stale write for the CDC lag
+    for id in ids:
+        db_repository.item_db_cache.invalidate(id)
+
+
+ReadBackendQuery = Annotated[
+    ReadBackend | None,
+    Query(description="Backend serving the read, `auto` falls back to Postgres on CDC lag"),
+]
+CacheQuery = Annotated[
+    bool,
+    Query(description="Set to false to run the Elasticsearch query instead of reusing a result"),
+]
+SearchQ = Annotated[
+    str | None, Query(max_length=1_000, description="Words to search in title and description")
+]
+TitleFilter = Annotated[list[str] | None, Query(description="Exact titles to keep")]
+HasDescriptionFilter = Annotated[
+    bool | None, Query(description="Keep only items with, or without, a description")
+]
+FacetField = Literal["title", "description", "version"]
+Fields = Annotated[tuple[str, ...] | None, Depends(sparse_fields(schemas.Item))]
+
+
+@router.get("/", response_model=Page[schemas.Item], responses=NOT_MODIFIED)
 async def read_items(
     *,
     db: Db,
+    es: Es,
+    response: Response,
+    token: Token,
     params: Annotated[Params, Depends(get_params)],
+    count: Annotated[
+        db_repository.CountStrategy,
+        Query(description="How `total` is computed, `exact` runs count(*) on every request"),
+    ] = db_repository.CountStrategy.exact,
+    title: Annotated[str | None, Query(description="Exact title to keep")] = None,
+    fields: Fields,
+    backend: ReadBackendQuery = None,
+    cache: CacheQuery = True,
+    if_none_match: IfNoneMatch = None,
 ) -> Any:
     """
     Retrieve items.
     """
     params = resolve_params(params)  # type: ignore
     limit, offset = get_limit_offset(params)
+    where = {"title": title} if title is not None else None
+    if token:
+        # Replicas may not have the writes of the token yet
+        use_primary(db)
+    # The version is read for the ETag even when it is not returned
+    columns = ITEM_COLUMNS if fields is None else list(dict.fromkeys([*fields, "version"]))
+
+    # Deeper pages are over the Elasticsearch result window
+    if (
+        read_backend.choose(backend) == ReadBackend.elasticsearch
+        and offset + limit <= settings.ES.MAX_RESULT_WINDOW
+    ):
+        result = await _read_es(
+            es,
+            lambda: es_repository.item.get_multi_count(
+                es,
+                offset=offset,
+                limit=limit,
+                exact=count == db_repository.CountStrategy.exact,
+                where=where,
+                fields=None if fields is None else columns,
+                # Results cached before the writes of the token could miss them
+                cache=cache and not token,
+            ),
+            token=token,
+            backend=backend,
+        )
+        if result is not None:
+            sources, total, total_exact = result
+            etag = make_etag(
+                "elasticsearch",
+                fields,
+                offset,
+                limit,
+                total,
+                total_exact,
+                [(source["id"], source.get("version", 1)) for source in sources],
+            )
+            if etag_matches(if_none_match, etag):
+                return _not_modified(etag)
+            response.headers["ETag"] = etag
+            page = Page.create(
+                sources, params, total=total, total_exact=total_exact, backend="elasticsearch"
+            )
+            return _narrow(page, fields, headers={"ETag": etag})
 
-    items, total = await db_repository.item_db_repository.get_multi_count(
-        db, offset=offset, limit=limit
+    repository = db_repository.item_db_repository
+    if if_none_match is not None:
+        # Compare the versions of the page before reading its rows
+        versions, total, total_exact = await repository.get_multi_versions_count(
+            db, offset=offset, limit=limit, count_strategy=count, where=where
+        )
+        etag = make_etag("postgres", fields, offset, limit, total, total_exact, versions)
+        if etag_matches(if_none_match, etag):
+            return _not_modified(etag)
+        # The count is reused, only the rows are read
+        rows = await repository.get_multi_rows(
+            db, offset=offset, limit=limit, where=where, columns=columns
+        )
+    else:
+        rows, total, total_exact = await repository.get_multi_rows_count(
+            db, offset=offset, limit=limit, count_strategy=count, where=where, columns=columns
+        )
+    etag = make_etag(
+        "postgres",
+        fields,
+        offset,
+        limit,
+        total,
+        total_exact,
+        [(row["id"], row["version"]) for row in rows],
     )
-    return create_page(items, total, params)
+    # The rows have the columns of `schemas.Item`, no need to validate them again
+    return trusted_response(
+        Page.create(
+            project(rows, fields), params, total=total, total_exact=total_exact, backend="postgres"
+        ),
+        headers={"ETag": etag},
+    )
+
 
+def _not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
+
+
+def _narrow(
+    page: BaseModel, fields: tuple[str, ...] | None, *, headers: dict[str, str] | None = None
+) -> Any:
+    """
+    `page` as it is when every field is returned, the route validates it. Otherwise
+    validated by its model narrowed to `fields`, which the route would reject.
+    """
+    if fields is None:
+        return page
+    model = type(page)[narrowed_model(schemas.Item, fields)]  # type: ignore[index]
+    return model_response(model.model_validate(dict(page)), headers=headers)
+
+
+@router.get("/cursor", response_model=CursorPage[schemas.Item])
+async def read_items_cursor(
+    *,
+    db: Db,
+    es: Es,
+    token: Token,
+    params: Annotated[CursorParams, Depends(get_cursor_params)],
+    fields: Fields,
+    title: Annotated[str | None, Query(description="Exact title to keep")] = None,
+    backend: ReadBackendQuery = None,
+    cache: CacheQuery = True,
+) -> Any:
+    """
+    Retrieve items with keyset (cursor) pagination.
+    """
+    if params.after is not None and not isinstance(params.after, int):
+        raise HTTPException(status_code=400, detail="invalid cursor")
+    where = {"title": title} if title is not None else None
+    if token:
+        # Replicas may not have the writes of the token yet
+        use_primary(db)
+
+    if read_backend.choose(backend) == ReadBackend.elasticsearch:
+        sources = await _read_es(
+            es,
+            lambda: es_repository.item.get_multi_after(
+                es,
+                after=params.after,
+                limit=params.size + 1,
+                where=where,
+                fields=fields,
+                cache=cache and not token,
+            ),
+            token=token,
+            backend=backend,
+        )
+        if sources is not None:
+            page = create_cursor_page(
+                sources, params, key=lambda source: source["id"], backend="elasticsearch"
+            )
+            return _narrow(page, fields)
+
+    rows = await db_repository.item_db_repository.get_multi_rows(
+        db, after=params.after, limit=params.size + 1, where=where, columns=fields or ITEM_COLUMNS
+    )
+    return trusted_response(
+        create_cursor_page(rows, params, key=lambda row: row["id"], backend="postgres")
+    )
+
+
+async def _read_es(
+    es: AsyncElasticsearch,
+    read: Callable[[], Awaitable[T]],
+    *,
+    token: ConsistencyToken,
+    backend: ReadBackend | None,
+) -> T | None:
+    """
+    Run an Elasticsearch read once the writes of `token` are searchable.
+    `None` when they still aren't after `READ.CONSISTENCY_WAIT`, or when the read failed
+    and `auto` falls back to Postgres.
+    """
+    try:
+        stale = await es_repository.item.wait_for_versions(es, token)
+        if stale:
+            logger.info("items {} not searchable yet, reading from postgres", sorted(stale))
+            return None
+        return await read()
+    except (ApiError, TransportError):
+        if read_backend.requested(backend) != ReadBackend.auto:
+            raise
+        logger.exception("elasticsearch read failed, reading from postgres")
+        read_backend.mark_es_failure()
+        return None
 
-@router.get("/get-es-items", response_model=list[schemas.Item])
+
+@router.get(
+    "/export",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"application/x-ndjson": {}, "text/csv": {}}}},
+)
+async def export_items(
+    *,
+    format: Annotated[Literal["ndjson", "csv"], Query(description="Output format")] = "ndjson",
+    after_id: Annotated[
+        int | None, Query(description="Resume after this id, the last one already exported")
+    ] = None,
+    batch_size: Annotated[int, Query(ge=1, le=10_000, description="Rows per fetch")] = 1_000,
+    fields: Fields,
+) -> Any:
+    """
+    Stream all items ordered by id as NDJSON or CSV.
+    """
+    columns = list(fields or ITEM_COLUMNS)
+
+    async def content() -> AsyncIterator[bytes]:
+        # The request session is closed before streaming starts, use a dedicated one
+        async with async_db_connection.session() as db:
+            rows = db_repository.item_db_repository.stream_rows(
+                db, after=after_id, yield_per=batch_size, columns=columns
+            )
+            if format == "csv":
+                yield _csv_lines([columns])
+            # The rows have the columns of `schemas.Item`, they are written as they are
+            async for chunk in chunked(rows, batch_size):
+                if format == "csv":
+                    yield _csv_lines([list(row.values()) for row in chunk])
+                else:
+                    yield b"".join(orjson.dumps(row) + b"\n" for row in chunk)
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        content(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="items.{format}"'},
+    )
+
+
+def _csv_lines(rows: list[list[Any]]) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue().encode()
+
+
+@router.get(
+    "/get-es-items",
+    response_class=StreamingResponse,
+    responses={
+        200: {
+            "content": {
+                "application/json": {
+                    "schema": {"type": "array", "items": {"$ref": "#/components/schemas/Item"}}
+                },
+                "application/x-ndjson": {},
+            }
+        }
+    },
+)
 async def get_es_items(
     *,
+    format: Annotated[Literal["json", "ndjson"], Query(description="Output format")] = "json",
+    batch_size: Annotated[
+        int, Query(ge=1, le=10_000, description="Documents per search request")
+    ] = settings.ES.SCAN_BATCH_SIZE,
+    slices: Annotated[
+        int, Query(ge=1, le=32, description="Slices scanned in parallel, unordered when > 1")
+    ] = 1,
+    fields: Fields,
+) -> Any:
+    """
+    Stream all items from Elasticsearch.
+    """
+    model = narrowed_model(schemas.Item, fields)
+
+    async def content() -> AsyncIterator[bytes]:
+        async with async_es_connection.session() as es:
+            batches = es_repository.item.iter_batches(
+                es, fields=fields, batch_size=batch_size, slices=slices
+            )
+            separator = b"\n" if format == "ndjson" else b","
+            first = True
+            if format == "json":
+                yield b"["
+            async for batch in batches:
+                items = separator.join(
+                    model.model_validate(source).model_dump_json().encode() for source in batch
+                )
+                if format == "ndjson":
+                    yield items + separator
+                else:
+                    yield items if first else separator + items
+                first = False
+            if format == "json":
+                yield b"]"
+
+    media_type = "application/x-ndjson" if format == "ndjson" else "application/json"
+    return StreamingResponse(content(), media_type=media_type)
+
+
+@router.get("/search", response_model=CursorPage[schemas.ItemSearchHit])
+async def search_items(
+    *,
+    db: Db,
     es: Es,
+    token: Token,
+    params: Annotated[CursorParams, Depends(get_cursor_params)],
+    q: SearchQ = None,
+    prefix: Annotated[
+        bool, Query(description="Match the words as prefixes, for search-as-you-type")
+    ] = False,
+    title: TitleFilter = None,
+    has_description: HasDescriptionFilter = None,
+    highlight: Annotated[bool, Query(description="Return the matching fragments")] = True,
+    fields: Fields,
+    cache: CacheQuery = True,
 ) -> Any:
     """
-    Retrieve items.
+    Full-text search items in Elasticsearch, ranked by relevance.
+    """
+    sort = es_repository.item.search_sort(q)
+    if params.after is not None and not (
+        isinstance(params.after, list) and len(params.after) == len(sort)
+    ):
+        raise HTTPException(status_code=400, detail="invalid cursor")
+
+    # Searched once the writes of the token are, those still stale are read from Postgres
+    stale = await es_repository.item.wait_for_versions(es, token)
+    hits = await es_repository.item.search(
+        es,
+        q=q,
+        prefix=prefix,
+        filters=_search_filters(title, has_description),
+        highlight=highlight,
+        size=params.size + 1,
+        search_after=params.after,
+        fields=fields,
+        cache=cache and not token,
+    )
+    page = create_cursor_page(hits, params, key=lambda hit: hit["sort"])
+
+    fresh: dict[int, dict[str, Any]] = {}
+    stale_ids = [hit["_source"]["id"] for hit in page.items if hit["_source"]["id"] in stale]
+    if stale_ids:
+        # Through the session of the request on the primary, replicas may be as stale
+        use_primary(db)
+        rows = await db_repository.item_db_repository.get_many(db, ids=stale_ids)
+        fresh = {row.id: schemas.Item.model_validate(row).model_dump() for row in rows}
+    hit_model = narrowed_model(schemas.ItemSearchHit, fields and (*fields, "score", "highlight"))
+    results: CursorPage[Any] = CursorPage(
+        items=[
+            hit_model(
+                **fresh.get(hit["_source"]["id"], hit["_source"]),
+                score=hit.get("_score"),
+                highlight={
+                    field.removesuffix(".prefix"): fragments
+                    for field, fragments in hit.get("highlight", {}).items()
+                },
+            )
+            for hit in page.items
+            # Deleted since it was indexed
+            if hit["_source"]["id"] not in stale or hit["_source"]["id"] in fresh
+        ],
+        size=page.size,
+        next_cursor=page.next_cursor,
+        backend="elasticsearch",
+    )
+    return results if fields is None else model_response(results)
+
+
+def _search_filters(title: list[str] | None, has_description: bool | None) -> list[dict[str, Any]]:
+    filters: list[dict[str, Any]] = []
+    if title:
+        filters.append({"terms": {"title.keyword": title}})
+    if has_description is not None:
+        exists = {"exists": {"field": "description"}}
+        filters.append(exists if has_description else {"bool": {"must_not": exists}})
+    return filters
+
+
+@router.get("/facets", response_model=schemas.Facets)
+async def read_facets(
+    *,
+    es: Es,
+    field: Annotated[
+        list[FacetField] | None, Query(description="Fields to count values of, `title` by default")
+    ] = None,
+    size: Annotated[int, Query(ge=1, le=1_000, description="Values counted per field")] = 10,
+    cardinality: Annotated[
+        bool, Query(description="Add the approximate number of distinct values")
+    ] = False,
+    histogram: Annotated[
+        Literal["id", "version"] | None, Query(description="Numeric field to count by interval")
+    ] = None,
+    interval: Annotated[
+        float | None, Query(gt=0, description="Width of the histogram intervals, required by it")
+    ] = None,
+    q: SearchQ = None,
+    title: TitleFilter = None,
+    has_description: HasDescriptionFilter = None,
+    cache: CacheQuery = True,
+) -> Any:
+    """
+    Count the most frequent values of item fields, in one aggregation request.
+    """
+    histogram_by = None
+    if histogram is not None:
+        if interval is None:
+            raise HTTPException(status_code=400, detail="histogram requires an interval")
+        histogram_by = (histogram, interval)
+
+    try:
+        return await es_repository.item.facets(
+            es,
+            fields=list(dict.fromkeys(field or ["title"])),
+            query=es_repository.item.search_query(
+                q, filters=_search_filters(title, has_description)
+            ),
+            size=size,
+            cardinality=cardinality,
+            histogram=histogram_by,
+            cache=cache,
+        )
+    except ApiError as e:
+        # An interval too narrow for the field exceeds `search.max_buckets`
+        if e.status_code != 400 and "too_many_buckets" not in str(e):
+            raise
+        raise HTTPException(status_code=400, detail=f"invalid facets request: {e.message}") from e
+
+
+@router.get("/facets/{field}", response_model=CursorPage[schemas.FacetBucket])
+async def read_facet_values(
+    *,
+    es: Es,
+    field: FacetField,
+    cursor: Annotated[
+        str | None, Query(description="Opaque cursor returned as `next_cursor` by the last page")
+    ] = None,
+    size: Annotated[int, Query(ge=1, le=10_000, description="Values per page")] = 1_000,
+    q: SearchQ = None,
+    title: TitleFilter = None,
+    has_description: HasDescriptionFilter = None,
+    cache: CacheQuery = True,
+) -> Any:
     """
-    print(await es_repository.item.get_all(es=es))
-    return await es_repository.item.get_all(es=es)
+    Page through every value of a field with its count, in value order.
+    """
+    try:
+        after = decode_cursor(cursor) if cursor is not None else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail="invalid cursor") from e
+    if after is not None and not isinstance(after, dict):
+        raise HTTPException(status_code=400, detail="invalid cursor")
+
+    buckets, after_key = await es_repository.item.facet_values(
+        es,
+        field,
+        query=es_repository.item.search_query(q, filters=_search_filters(title, has_description)),
+        size=size,
+        after=after,
+        cache=cache,
+    )
+    return CursorPage(
+        items=buckets,
+        size=size,
+        next_cursor=encode_cursor(after_key) if after_key is not None else None,
+        backend="elasticsearch",
+    )
+
 
+@router.get("/batch", response_model=list[schemas.Item])
+async def read_items_batch(
+    *,
+    ids: Annotated[list[int], Query(min_length=1, max_length=1_000, description="Item ids")],
+) -> Any:
+    """
+    Get many items by ID, missing ones are left out.
+    """
+    items = await asyncio.gather(
+        *(
+            db_repository.item_db_cache.get_or_load(id, db_repository.item_db_loader.load)
+            for id in dict.fromkeys(ids)
+        )
+    )
+    return [item for item in items if item is not None]
+
+
+@router.get("/cache-stats", response_model=schemas.CacheStats)
+async def read_cache_stats() -> Any:
+    """
+    Get the item cache counters.
+    """
+    return _cache_stats(db_repository.item_db_cache)
 
-@router.get("/{id}", response_model=schemas.Item)
+
+@router.get("/search-cache-stats", response_model=schemas.CacheStats)
+async def read_search_cache_stats() -> Any:
+    """
+    Get the Elasticsearch result cache counters.
+    """
+    cache = es_repository.item.result_cache
+    if cache is None:
+        raise HTTPException(status_code=404, detail="no result cache")
+    return _cache_stats(cache)
+
+
+def _cache_stats(cache: LRUCache) -> schemas.CacheStats:
+    counters = cache.counters
+    lookups = counters.hits + counters.misses
+    return schemas.CacheStats(
+        size=len(cache),
+        max_size=cache.max_size,
+        ttl=cache.ttl,
+        hits=counters.hits,
+        misses=counters.misses,
+        evictions=counters.evictions,
+        expirations=counters.expirations,
+        invalidations=counters.invalidations,
+        hit_ratio=counters.hits / lookups if lookups else 0,
+        last_event_offset=change_stream.last_event.offset if change_stream.last_event else None,
+    )
+
+
+@router.get("/{id}", response_model=schemas.Item, responses=NOT_MODIFIED)
 async def read_item(
     *,
     db: Db,
+    response: Response,
     id: int,
+    fields: Fields,
+    if_none_match: IfNoneMatch = None,
 ) -> Any:
     """
     Get item by ID.
     """
-    item = await db_repository.item_db_repository.get(db=db, id=id)
-    if not item:
-        raise HTTPException(status_code=404, detail="item not found")
+    cache = db_repository.item_db_cache
+    epoch = cache.epoch
+    item = cache.get(id)
+    if item is None:
+        if if_none_match is not None:
+            # Only the version is read while the client copy is current
+            version = await db_repository.item_db_repository.get_version(db, id)
+            if version is not None and etag_matches(if_none_match, version_etag(version)):
+                return _not_modified(version_etag(version))
+
+        item = await db_repository.item_db_loader.load(id)
+        if not item:
+            raise HTTPException(status_code=404, detail="item not found")
+        cache.set(id, item, epoch=epoch)
+
+    etag = version_etag(item.version)
+    if etag_matches(if_none_match, etag):
+        return _not_modified(etag)
+    response.headers["ETag"] = etag
+    if fields is not None:
+        model = narrowed_model(schemas.Item, fields)
+        return model_response(model.model_validate(item), headers={"ETag": etag})
     return item
 
 
-@router.put("/{id}", response_model=schemas.Item)
+@router.put("/{id}", response_model=schemas.Item, responses={412: {"description": "Item changed"}})
 async def update_item(
     *,
     db: Db,
+    response: Response,
+    token: Token,
     id: int,
     item_in: schemas.ItemUpdate,
+    if_match: IfMatch = None,
 ) -> Any:
     """
-    Update an item.
+    Update an item, only if it is still at the version of `If-Match` when it is set.
     """
-    item = await db_repository.item_db_repository.get(db=db, id=id)
+    item = await db_repository.item_db_repository.update_by_id(
+        db=db,
+        id=id,
+        update_data=item_in.model_dump(exclude_unset=True),
+        versions=etag_versions(if_match) if if_match is not None else None,
+    )
+    db_repository.item_db_cache.invalidate(id)
     if not item:
+        # A missing item fails any `If-Match`, `*` included (RFC 9110 13.1.1)
+        if if_match is not None:
+            raise HTTPException(status_code=412, detail="item changed or deleted")
         raise HTTPException(status_code=404, detail="item not found")
-    item = await db_repository.item_db_repository.update(
-        db=db, db_obj=item, update_data=item_in.dict(exclude_unset=True)
-    )
+    _set_consistency_token(response, token, {item.id: item.version})
+    response.headers["ETag"] = version_etag(item.version)
     return item
 
 
-@router.delete("/{id}", response_model=schemas.Item)
+@router.delete(
+    "/{id}", response_model=schemas.Item, responses={412: {"description": "Item changed"}}
+)
 async def delete_item(
     *,
     db: Db,
+    response: Response,
+    token: Token,
     id: int,
+    if_match: IfMatch = None,
 ) -> Any:
     """
-    Delete an item.
+    Delete an item, only if it is still at the version of `If-Match` when it is set.
     """
-    item = await db_repository.item_db_repository.get(db=db, id=id)
-
+    item = await db_repository.item_db_repository.delete_by_id(
+        db=db, id=id, versions=etag_versions(if_match) if if_match is not None else None
+    )
+    db_repository.item_db_cache.invalidate(id)
     if not item:
+        if if_match is not None:
+            raise HTTPException(status_code=412, detail="item changed or deleted")
         raise HTTPException(status_code=404, detail="item not found")
-
-    await db_repository.item_db_repository.delete_by_id(db=db, id=id)
-
+    _set_consistency_token(response, token, {item.id: None})
     return item
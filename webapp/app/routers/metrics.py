@@ -0,0 +1,14 @@
+from fastapi import APIRouter, Response
+from prometheus_client import CONTENT_TYPE_LATEST
+
+from app.core.metrics import render_metrics
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False)
+async def read_metrics() -> Response:
+    """
+    Prometheus metrics, of every worker when they share `PROMETHEUS_MULTIPROC_DIR`.
+    """
+    return Response(render_metrics(), media_type=CONTENT_TYPE_LATEST)
@@ -1 +1,5 @@
+from .bulk import *
+from .cache import *
+from .cdc import *
+from .facet import *
 from .item import *
@@ -0,0 +1,50 @@
+from typing import Literal
+
+from pydantic import BaseModel
+
+__all__ = [
+    "BulkRecordError",
+    "BulkChunkResult",
+    "BulkIngestResult",
+    "BulkItemStatus",
+    "BulkWriteResult",
+]
+
+
+class BulkRecordError(BaseModel):
+    # Position of the record in the request body, None when the whole chunk failed
+    index: int | None
+    detail: str
+
+
+class BulkChunkResult(BaseModel):
+    chunk: int
+    offset: int
+    received: int
+    inserted: int
+    ids: list[int] | None = None
+    errors: list[BulkRecordError] = []
+    elapsed: float
+
+
+class BulkIngestResult(BaseModel):
+    received: int = 0
+    inserted: int = 0
+    failed: int = 0
+    elapsed: float = 0
+    rows_per_second: float = 0
+    chunks: list[BulkChunkResult] = []
+    error: str | None = None
+
+
+class BulkItemStatus(BaseModel):
+    id: int
+    status: Literal["updated", "deleted", "not_found", "failed"]
+    detail: str | None = None
+
+
+class BulkWriteResult(BaseModel):
+    succeeded: int = 0
+    not_found: int = 0
+    failed: int = 0
+    results: list[BulkItemStatus] = []
@@ -0,0 +1,17 @@
+from pydantic import BaseModel
+
+__all__ = ["CacheStats"]
+
+
+class CacheStats(BaseModel):
+    size: int
+    max_size: int
+    ttl: float
+    hits: int
+    misses: int
+    evictions: int
+    expirations: int
+    invalidations: int
+    hit_ratio: float
+    # Offset of the last change event applied, `None` if none was received yet
+    last_event_offset: int | None = None
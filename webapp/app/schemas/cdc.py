@@ -0,0 +1,24 @@
+from pydantic import BaseModel
+
+__all__ = ["CdcLag", "LatencyPercentiles"]
+
+
+class LatencyPercentiles(BaseModel):
+    # Probes measured since startup, the percentiles cover the last `CDC.HEARTBEAT_WINDOW`
+    count: int
+    p50: float | None = None
+    p95: float | None = None
+    p99: float | None = None
+
+
+class CdcLag(BaseModel):
+    # Lag in seconds `auto` reads compare to `READ.MAX_LAG`, the change stream one
+    lag: float | None
+    # Seconds from a commit until its change event reached this process
+    change_stream_lag: float | None
+    # Seconds from a commit until it is searchable, measured by the heartbeat probes
+    heartbeat_lag: float | None
+    # Whether `auto` reads are served by Elasticsearch
+    es_usable: bool
+    # Heartbeat latencies by stage, `kafka` and `elasticsearch`
+    stages: dict[str, LatencyPercentiles]
@@ -0,0 +1,25 @@
+from typing import Any
+
+from pydantic import BaseModel
+
+__all__ = ["FacetBucket", "Facet", "Facets"]
+
+
+class FacetBucket(BaseModel):
+    # Field value, or first value of the interval for a histogram
+    value: Any
+    count: int
+
+
+class Facet(BaseModel):
+    buckets: list[FacetBucket]
+    # Items whose value is not in the buckets
+    other_count: int
+    # Approximate number of distinct values, when requested
+    cardinality: int | None = None
+
+
+class Facets(BaseModel):
+    total: int
+    facets: dict[str, Facet]
+    histogram: list[FacetBucket] | None = None
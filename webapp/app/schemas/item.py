@@ -1,8 +1,15 @@
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
 
 from .optional import OptionalField
 
-__all__ = ["Item", "ItemCreate", "ItemUpdate"]
+__all__ = [
+    "Item",
+    "ItemCreate",
+    "ItemUpdate",
+    "ItemBulkUpdate",
+    "ItemBulkDelete",
+    "ItemSearchHit",
+]
 
 
 class ItemBase(BaseModel):
@@ -20,14 +27,33 @@ class ItemUpdate(ItemBase):
     pass
 
 
+# Properties to receive on bulk item update
+class ItemBulkUpdate(ItemUpdate):
+    id: int
+
+
+# Properties to receive on bulk item delete
+class ItemBulkDelete(BaseModel):
+    ids: list[int] = Field(min_length=1)
+
+
 # Properties shared by models stored in DB
 class ItemInDBBase(ItemBase):
     model_config = ConfigDict(from_attributes=True)
 
     id: int
     title: str
+    # Documents indexed before the column existed have none
+    version: int = 1
 
 
 # Properties to return to client
 class Item(ItemInDBBase):
     model_config = ConfigDict(from_attributes=True)
+
+
+# Item found by full-text search
+class ItemSearchHit(Item):
+    score: float | None = None
+    # Matching fragments by field, the terms are wrapped in <em></em>
+    highlight: dict[str, list[str]] = {}
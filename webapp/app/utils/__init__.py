@@ -1 +1,7 @@
+from .checksum import *
+from .consistency import *
+from .etag import *
+from .fields import *
 from .pagination import *
+from .responses import *
+from .stream import *
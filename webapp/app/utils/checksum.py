@@ -0,0 +1,27 @@
+__all__ = ["ROW_HASH_MODULUS", "ROW_HASH_MULTIPLIER", "row_hash", "ROW_HASH_SCRIPT"]
+
+# Largest prime under 2^24, a bucket sum of hashes stays exact in a double up to 2^29 rows
+ROW_HASH_MODULUS = 16_777_213
+ROW_HASH_MULTIPLIER = 48_271
+
+# Same arithmetic in Painless, for the sum aggregations of Elasticsearch
+ROW_HASH_SCRIPT = {
+    "source": (
+        "long m = params.m; long a = params.a;"
+        "long version = doc['version'].size() == 0 ? 0 : doc['version'].value;"
+        "long x = (Math.floorMod(doc['id'].value, m) * a + version) % m;"
+        "return (x * x) % m;"
+    ),
+    "params": {"m": ROW_HASH_MODULUS, "a": ROW_HASH_MULTIPLIER},
+}
+
+
+def row_hash(id: int, version: int) -> int:
+    """Hash of `(id, version)` summed by the range checksums of Postgres and Elasticsearch
+
+    Squared so that the changes of two rows rarely cancel out in a sum, as they do with
+    `sum(version)` when a row is a version ahead and another one a version behind.
+    Computed with 64-bit integers in both stores, the products stay under 2^48.
+    """
+    x = ((id % ROW_HASH_MODULUS) * ROW_HASH_MULTIPLIER + version) % ROW_HASH_MODULUS
+    return (x * x) % ROW_HASH_MODULUS
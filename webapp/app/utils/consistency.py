@@ -0,0 +1,70 @@
+from typing import Annotated
+
+from fastapi import Header, HTTPException
+
+from .pagination import decode_cursor, encode_cursor
+
+__all__ = [
+    "CONSISTENCY_TOKEN_HEADER",
+    "ConsistencyToken",
+    "encode_consistency_token",
+    "decode_consistency_token",
+    "get_consistency_token",
+    "merge_consistency_tokens",
+]
+
+CONSISTENCY_TOKEN_HEADER = "X-Consistency-Token"
+
+# Version each written id must have been replicated with, `None` for a deleted row
+ConsistencyToken = dict[int, int | None]
+
+# Only the most recent writes are kept so that the header stays small
+MAX_TOKEN_IDS = 100
+
+
+def encode_consistency_token(token: ConsistencyToken) -> str:
+    return encode_cursor([[id, version] for id, version in token.items()])
+
+
+def decode_consistency_token(value: str) -> ConsistencyToken:
+    """Decode a token produced by `encode_consistency_token`
+
+    Raises:
+        ValueError: The token is malformed
+    """
+    pairs = decode_cursor(value)
+    if not isinstance(pairs, list):
+        raise ValueError("invalid consistency token")
+    try:
+        return {int(id): None if version is None else int(version) for id, version in pairs}
+    except TypeError as e:
+        raise ValueError("invalid consistency token") from e
+
+
+def merge_consistency_tokens(*tokens: ConsistencyToken) -> ConsistencyToken:
+    """Merge tokens, the later write of an id wins and the oldest ids are dropped"""
+    merged: ConsistencyToken = {}
+    for token in tokens:
+        for id, version in token.items():
+            current = merged.pop(id, 0)
+            # Ids are never reused, a delete is the last write of an id
+            if version is None or current is None:
+                merged[id] = None
+            else:
+                merged[id] = max(current, version)
+    return dict(list(merged.items())[-MAX_TOKEN_IDS:])
+
+
+def get_consistency_token(
+    x_consistency_token: Annotated[
+        str | None,
+        Header(description="Token returned by writes, reads wait until they are visible"),
+    ] = None,
+) -> ConsistencyToken:
+    if not x_consistency_token:
+        return {}
+
+    try:
+        return decode_consistency_token(x_consistency_token)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail="invalid consistency token") from e
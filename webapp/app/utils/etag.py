@@ -0,0 +1,58 @@
+import hashlib
+import json
+from typing import Any
+
+__all__ = [
+    "make_etag",
+    "version_etag",
+    "etag_matches",
+    "etag_versions",
+]
+
+
+def version_etag(version: int) -> str:
+    """Strong ETag of a single row, its version"""
+    return f'"{version}"'
+
+
+def make_etag(*parts: Any) -> str:
+    """Strong ETag of a response built from `parts`, such as the versions of its rows"""
+    data = json.dumps(parts, default=str, separators=(",", ":")).encode()
+    return f'"{hashlib.blake2b(data, digest_size=16).hexdigest()}"'
+
+
+def _parse(header: str) -> list[str]:
+    return [tag.strip() for tag in header.split(",") if tag.strip()]
+
+
+def etag_matches(header: str | None, etag: str, *, weak: bool = True) -> bool:
+    """Whether `etag` is listed in an `If-None-Match` or `If-Match` header
+
+    `If-None-Match` compares weakly, ignoring the `W/` prefix, `If-Match` needs `weak=False`.
+    """
+    if header is None:
+        return False
+    for tag in _parse(header):
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            if not weak:
+                continue
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+def etag_versions(header: str) -> list[int] | None:
+    """Row versions listed in an `If-Match` header, None for `*`
+
+    Weak and malformed tags are left out, they never match.
+    """
+    versions = []
+    for tag in _parse(header):
+        if tag == "*":
+            return None
+        if tag.startswith('"') and tag.endswith('"') and tag[1:-1].isdigit():
+            versions.append(int(tag[1:-1]))
+    return versions
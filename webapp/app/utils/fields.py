@@ -0,0 +1,68 @@
+from functools import lru_cache
+from typing import Annotated, Any, Callable, Sequence
+
+from fastapi import HTTPException, Query
+from pydantic import BaseModel, create_model
+
+__all__ = ["sparse_fields", "narrowed_model", "project"]
+
+
+def sparse_fields(
+    model: type[BaseModel], *, always: Sequence[str] = ("id",)
+) -> Callable[..., tuple[str, ...] | None]:
+    """Dependency reading the `fields` query parameter, a comma separated list of the
+    fields of `model` to return
+
+    The fields are returned in the order of `model` with the `always` ones added, `None`
+    when the parameter is not set.
+
+    Raises:
+        HTTPException: 400 when a field is not one of `model`
+    """
+
+    def get_fields(
+        fields: Annotated[
+            str | None,
+            Query(
+                description="Comma separated fields to return, all by default: "
+                + ", ".join(model.model_fields)
+            ),
+        ] = None,
+    ) -> tuple[str, ...] | None:
+        if fields is None:
+            return None
+
+        requested = {name.strip() for name in fields.split(",") if name.strip()}
+        unknown = requested - model.model_fields.keys()
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"unknown fields: {sorted(unknown)}")
+        return tuple(name for name in model.model_fields if name in requested or name in always)
+
+    return get_fields
+
+
+@lru_cache(maxsize=256)
+def narrowed_model(model: type[BaseModel], fields: tuple[str, ...] | None) -> type[BaseModel]:
+    """`model` with only `fields`, `model` itself when `fields` is None
+
+    Fields of `model` missing from `fields` are dropped along with their validation, the
+    others keep their type and default.
+    """
+    if fields is None:
+        return model
+    return create_model(  # type: ignore[call-overload]
+        f"{model.__name__}Fields",
+        __config__=model.model_config,
+        **{
+            name: (info.annotation, info)
+            for name, info in model.model_fields.items()
+            if name in fields
+        },
+    )
+
+
+def project(rows: list[dict[str, Any]], fields: Sequence[str] | None) -> list[dict[str, Any]]:
+    """Keep only `fields` of rows read with more columns"""
+    if fields is None:
+        return rows
+    return [{name: row[name] for name in fields} for row in rows]
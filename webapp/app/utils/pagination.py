@@ -1,10 +1,35 @@
-from typing import Annotated
+import base64
+import json
+from typing import Annotated, Any, Callable, Generic, Sequence, TypeVar
 
-from fastapi import Query
+from fastapi import HTTPException, Query
 from fastapi_pagination import Params
 from fastapi_pagination.bases import AbstractParams
+from fastapi_pagination.default import Page as BasePage
+from pydantic import BaseModel
 
-__all__ = ["get_limit_offset", "get_params", "get_objects_params", "get_videos_params"]
+__all__ = [
+    "Page",
+    "get_limit_offset",
+    "get_params",
+    "get_objects_params",
+    "get_videos_params",
+    "CursorParams",
+    "CursorPage",
+    "get_cursor_params",
+    "encode_cursor",
+    "decode_cursor",
+    "create_cursor_page",
+]
+
+T = TypeVar("T")
+
+
+class Page(BasePage[T], Generic[T]):
+    # False when `total` is a planner estimate or a stale cached count
+    total_exact: bool = True
+    # `postgres` or `elasticsearch`, whichever served the page
+    backend: str | None = None
 
 
 def get_params(
@@ -34,3 +59,63 @@ def get_limit_offset(params: AbstractParams) -> tuple[int, int]:
     raw_params = params.to_raw_params()
     limit, offset = raw_params.limit, raw_params.offset  # type: ignore
     return limit, offset
+
+
+def encode_cursor(value: Any) -> str:
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str) -> Any:
+    """Decode a cursor produced by `encode_cursor`
+
+    Raises:
+        ValueError: The cursor is malformed
+    """
+    # binascii.Error, UnicodeDecodeError and JSONDecodeError are all ValueErrors
+    return json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+
+
+class CursorParams(BaseModel):
+    after: Any | None = None
+    size: int
+
+
+def get_cursor_params(
+    cursor: Annotated[
+        str | None, Query(description="Opaque cursor returned as `next_cursor` by the last page")
+    ] = None,
+    size: Annotated[int, Query(ge=1, le=100, description="Page size")] = 50,
+) -> CursorParams:
+    if cursor is None:
+        return CursorParams(size=size)
+
+    try:
+        after = decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail="invalid cursor") from e
+    return CursorParams(after=after, size=size)
+
+
+class CursorPage(BaseModel, Generic[T]):
+    items: Sequence[T]
+    size: int
+    next_cursor: str | None = None
+    # `postgres` or `elasticsearch`, whichever served the page
+    backend: str | None = None
+
+
+def create_cursor_page(
+    items: Sequence[T],
+    params: CursorParams,
+    *,
+    key: Callable[[T], Any],
+    backend: str | None = None,
+) -> CursorPage[T]:
+    """Build a page from up to `params.size + 1` items ordered by `key`
+
+    The extra item only signals that another page exists and is not returned.
+    """
+    has_next = len(items) > params.size
+    items = items[: params.size]
+    next_cursor = encode_cursor(key(items[-1])) if has_next else None
+    return CursorPage(items=items, size=params.size, next_cursor=next_cursor, backend=backend)
@@ -0,0 +1,40 @@
+from typing import Any, Mapping
+
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+
+from app.core.profiling import serialization_timer
+
+__all__ = ["ProfiledORJSONResponse", "trusted_response", "model_response"]
+
+
+class ProfiledORJSONResponse(ORJSONResponse):
+    """`ORJSONResponse` adding its rendering to the serialization time of the request"""
+
+    def render(self, content: Any) -> bytes:
+        with serialization_timer():
+            return super().render(content)
+
+
+def trusted_response(
+    content: BaseModel, *, headers: Mapping[str, str] | None = None
+) -> ProfiledORJSONResponse:
+    """Serialize a response model with orjson, without validating it against the
+    `response_model` of the route or dumping it again
+
+    Only for content built from trusted values that already match the response schema,
+    such as the rows of `get_multi_rows`: its fields are serialized as they are, so they
+    must be JSON types, not nested models.
+    """
+    return ProfiledORJSONResponse(dict(content), headers=headers)
+
+
+def model_response(
+    content: BaseModel, *, headers: Mapping[str, str] | None = None
+) -> ProfiledORJSONResponse:
+    """Serialize a model other than the `response_model` of the route, such as one narrowed
+    by `narrowed_model`, that the route would reject
+    """
+    with serialization_timer():
+        dumped = content.model_dump(mode="json")
+    return ProfiledORJSONResponse(dumped, headers=headers)
@@ -0,0 +1,159 @@
+import json
+from typing import Any, AsyncIterable, AsyncIterator, TypeVar
+
+__all__ = ["chunked", "iter_json_records"]
+
+T = TypeVar("T")
+
+_WHITESPACE = b" \t\r\n"
+_WHITESPACE_CHARS = " \t\r\n"
+_DELIMITERS = ",]" + _WHITESPACE_CHARS
+
+
+class _NdjsonDecoder:
+    def __init__(self) -> None:
+        self.buffer = b""
+
+    def feed(self, data: bytes) -> list[Any]:
+        *lines, self.buffer = (self.buffer + data).split(b"\n")
+        return [json.loads(line) for line in lines if line.strip()]
+
+    def close(self) -> list[Any]:
+        return self.feed(b"\n")
+
+
+class _JsonArrayDecoder:
+    def __init__(self) -> None:
+        self.buffer = b""
+        self.closed = False
+        # Right after `[` a record or `]`, after `,` a record, after a record `,` or `]`
+        self.expect = "record_or_end"
+        self.decoder = json.JSONDecoder()
+
+    def feed(self, data: bytes, *, final: bool = False) -> list[Any]:
+        self.buffer += data
+        if self.closed:
+            if self.buffer.strip(_WHITESPACE):
+                raise ValueError("unexpected data after JSON array")
+            self.buffer = b""
+            return []
+
+        text = _decode_utf8(self.buffer, final=final)
+        records, pos = self._decode_items(text, final=final)
+        self.buffer = text[pos:].encode("utf-8") + self.buffer[len(text.encode("utf-8")) :]
+        return records
+
+    def close(self) -> list[Any]:
+        records = self.feed(b"", final=True)
+        if not self.closed:
+            raise ValueError("unterminated JSON array")
+        return records
+
+    def _decode_items(self, text: str, *, final: bool) -> tuple[list[Any], int]:
+        records: list[Any] = []
+        pos = 0
+        while True:
+            while pos < len(text) and text[pos] in _WHITESPACE_CHARS:
+                pos += 1
+            if pos >= len(text):
+                return records, pos
+
+            char = text[pos]
+            if char == "]" and self.expect != "record":
+                return records, self._close(text, pos)
+            if self.expect == "separator":
+                if char != ",":
+                    raise ValueError(f"expected ',' or ']' in JSON array at {char!r}")
+                self.expect = "record"
+                pos += 1
+                continue
+
+            decoded = self._decode_one(text, pos, final=final)
+            if decoded is None:
+                # The record continues in the next chunk.
+                return records, pos
+
+            record, end = decoded
+            records.append(record)
+            self.expect = "separator"
+            pos = end
+
+    def _close(self, text: str, pos: int) -> int:
+        self.closed = True
+        if text[pos + 1 :].strip():
+            raise ValueError("unexpected data after JSON array")
+        return len(text)
+
+    def _decode_one(self, text: str, pos: int, *, final: bool) -> tuple[Any, int] | None:
+        if text[pos] in '{["':
+            try:
+                return self.decoder.raw_decode(text, pos)
+            except json.JSONDecodeError:
+                if final:
+                    raise
+                return None
+
+        # A number or a literal is complete once a delimiter follows, `1e` may be `1e5`
+        stop = next((i for i in range(pos, len(text)) if text[i] in _DELIMITERS), None)
+        if stop is None:
+            if not final:
+                return None
+            stop = len(text)
+        record, end = self.decoder.raw_decode(text[:stop], pos)
+        if end != stop:
+            raise ValueError(f"invalid JSON value {text[pos:stop]!r}")
+        return record, end
+
+
+def _decode_utf8(data: bytes, *, final: bool) -> str:
+    if final:
+        return data.decode("utf-8")
+
+    # Do not split a multi-byte UTF-8 sequence at the end of a network chunk.
+    for cut in range(min(4, len(data)) + 1):
+        try:
+            return data[: len(data) - cut].decode("utf-8")
+        except UnicodeDecodeError:
+            continue
+    raise ValueError("invalid UTF-8 in request body")
+
+
+async def iter_json_records(chunks: AsyncIterable[bytes]) -> AsyncIterator[Any]:
+    """Incrementally decode a JSON-array or NDJSON body into records.
+
+    The format is detected from the first non-whitespace byte: `[` starts a JSON array,
+    anything else is read as newline-delimited JSON. Only the current partial record is
+    buffered, so arbitrarily large bodies can be consumed.
+
+    Raises:
+        ValueError: The body is neither a valid JSON array nor valid NDJSON.
+    """
+    decoder: _NdjsonDecoder | _JsonArrayDecoder | None = None
+    head = b""
+
+    async for chunk in chunks:
+        if decoder is None:
+            head = (head + chunk).lstrip(_WHITESPACE)
+            if not head:
+                continue
+            decoder = _JsonArrayDecoder() if head.startswith(b"[") else _NdjsonDecoder()
+            chunk = head[1:] if isinstance(decoder, _JsonArrayDecoder) else head
+
+        for record in decoder.feed(chunk):
+            yield record
+
+    if decoder is not None:
+        for record in decoder.close():
+            yield record
+
+
+async def chunked(items: AsyncIterable[T], size: int) -> AsyncIterator[list[T]]:
+    """Group an async iterable into lists of at most `size` items."""
+    chunk: list[T] = []
+    async for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
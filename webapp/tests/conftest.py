@@ -0,0 +1,11 @@
+import os
+
+# Settings are read on import of `app`, the tests need no Postgres nor Elasticsearch
+for name, value in {
+    "DB__USER": "test",
+    "DB__PASSWORD": "test",
+    "DB__DB": "test",
+    "CDC__SOURCE": "none",
+    "CDC__HEARTBEAT_ENABLED": "false",
+}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,166 @@
+import asyncio
+from typing import Any
+
+from app.cdc.apply import BulkApplyWorker
+from app.cdc.events import ChangeEvent
+from app.cdc.sources import MemoryEventSource
+
+
+class Source(MemoryEventSource):
+    def __init__(self, *, offset_versions: bool = False) -> None:
+        super().__init__("items")
+        self.offset_versions = offset_versions
+        self.commits: list[int] = []
+
+    async def commit(self, event: ChangeEvent) -> None:
+        await super().commit(event)
+        self.commits.append(event.offset)
+
+
+class FakeES:
+    """
+    `bulk` answering each item with the next status of its document id, 201 by default.
+    """
+
+    def __init__(self, statuses: dict[str, list[int]] | None = None) -> None:
+        self.statuses = statuses or {}
+        self.requests: list[list[dict[str, Any]]] = []
+
+    async def bulk(self, operations: list[dict[str, Any]]) -> dict[str, Any]:
+        self.requests.append(operations)
+        items = []
+        for operation in operations:
+            op = next(iter(operation))
+            if op not in ("index", "delete"):
+                continue
+            id = operation[op]["_id"]
+            statuses = self.statuses.get(id)
+            status = statuses.pop(0) if statuses else 201
+            items.append({op: {"_id": id, "status": status}})
+        return {"items": items}
+
+
+def _run(worker: BulkApplyWorker, es: Any, source: Source) -> None:
+    async def main() -> None:
+        task = asyncio.create_task(worker.run(es))
+        await source.close()
+        await task
+
+    asyncio.run(main())
+
+
+def test_only_the_last_change_of_a_row_is_sent() -> None:
+    source = Source()
+    source.publish({"id": 1}, {"id": 1, "title": "a"})
+    source.publish({"id": 2}, {"id": 2, "title": "b"})
+    source.publish({"id": 1}, {"id": 1, "title": "c", "__op": "u", "__lsn": 10})
+    source.publish({"id": 2}, None)
+    es = FakeES()
+    worker = BulkApplyWorker(source, index_name="item", max_interval=0.01)
+    _run(worker, es, source)
+
+    assert es.requests == [
+        [
+            {"index": {"_index": "item", "_id": "1"}},
+            {"id": 1, "title": "c"},
+            {"delete": {"_index": "item", "_id": "2"}},
+        ]
+    ]
+    assert (worker.stats.events, worker.stats.indexed, worker.stats.deleted) == (4, 1, 1)
+    assert source.commits == [3]
+
+
+def test_offsets_are_committed_in_order() -> None:
+    async def main() -> None:
+        source = Source()
+        pending: list[asyncio.Future[None]] = []
+
+        class SlowES(FakeES):
+            async def bulk(self, operations: list[dict[str, Any]]) -> dict[str, Any]:
+                future = asyncio.get_running_loop().create_future()
+                pending.append(future)
+                await future
+                return await super().bulk(operations)
+
+        worker = BulkApplyWorker(source, max_actions=1, max_in_flight=3, max_interval=0.01)
+        task = asyncio.create_task(worker.run(SlowES()))
+        for id in range(3):
+            source.publish({"id": id}, {"id": id})
+        while len(pending) < 3:
+            await asyncio.sleep(0.01)
+
+        # The second batch is acknowledged first, its offset waits for the first one
+        pending[1].set_result(None)
+        await asyncio.sleep(0.01)
+        assert source.commits == []
+        pending[0].set_result(None)
+        await asyncio.sleep(0.01)
+        assert source.commits == [0, 1]
+        pending[2].set_result(None)
+        await source.close()
+        await task
+        assert source.commits == [0, 1, 2]
+
+    asyncio.run(main())
+
+
+def test_conflicts_are_skipped_and_throttled_actions_retried() -> None:
+    source = Source()
+    source.publish({"id": 1}, {"id": 1})
+    source.publish({"id": 2}, {"id": 2})
+    source.publish({"id": 3}, None)
+    es = FakeES({"1": [409], "2": [429, 201], "3": [404]})
+    worker = BulkApplyWorker(source, max_interval=0.01)
+    _run(worker, es, source)
+
+    assert len(es.requests) == 2
+    assert es.requests[1] == [{"index": {"_index": "item", "_id": "2"}}, {"id": 2}]
+    assert worker.stats.conflicts == 1
+    assert worker.stats.retries == 1
+    assert worker.stats.indexed == 1
+    # Deleting a missing document is done
+    assert worker.stats.deleted == 1
+    assert source.commits == [2]
+
+
+def test_documents_are_versioned_with_offsets() -> None:
+    source = Source(offset_versions=True)
+    source.publish({"id": 1}, {"id": 1})
+    source.publish({"id": 2}, None)
+    es = FakeES()
+    _run(BulkApplyWorker(source, max_interval=0.01), es, source)
+
+    assert es.requests[0][0]["index"]["version"] == 0
+    assert es.requests[0][0]["index"]["version_type"] == "external_gte"
+    assert es.requests[0][2]["delete"]["version"] == 1
+
+
+def test_events_before_min_lsn_are_skipped() -> None:
+    source = Source()
+    source.publish({"id": 1}, {"id": 1, "__lsn": 5})
+    source.publish({"id": 2}, {"id": 2, "__lsn": 15})
+    source.publish({"id": 3}, None)
+    es = FakeES()
+    worker = BulkApplyWorker(source, max_interval=0.01, min_lsn=10)
+    _run(worker, es, source)
+
+    assert es.requests == [
+        [
+            {"index": {"_index": "item", "_id": "2"}},
+            {"id": 2},
+            {"delete": {"_index": "item", "_id": "3"}},
+        ]
+    ]
+    assert worker.stats.skipped == 1
+    assert source.commits == [2]
+
+
+def test_backfilled_documents_have_the_version_0() -> None:
+    source = Source()
+    source.publish({"id": 1}, {"id": 1})
+    es = FakeES()
+    _run(BulkApplyWorker(source, max_interval=0.01, backfill=True), es, source)
+
+    assert es.requests[0][0] == {
+        "index": {"_index": "item", "_id": "1", "version": 0, "version_type": "external_gte"}
+    }
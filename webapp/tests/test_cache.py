@@ -0,0 +1,130 @@
+import asyncio
+
+from app.core.cache import LRUCache, QueryResultCache
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_lru_eviction() -> None:
+    cache: LRUCache[int, str] = LRUCache(max_size=2, ttl=10)
+    cache.set(1, "a")
+    cache.set(2, "b")
+    assert cache.get(1) == "a"
+    cache.set(3, "c")
+    assert cache.get(2) is None
+    assert cache.get(1) == "a"
+    assert cache.get(3) == "c"
+    assert cache.counters.evictions == 1
+
+
+def test_ttl_expiration() -> None:
+    clock = Clock()
+    cache: LRUCache[int, str] = LRUCache(max_size=2, ttl=10, clock=clock)
+    cache.set(1, "a")
+    clock.now = 9.9
+    assert cache.get(1) == "a"
+    clock.now = 10
+    assert cache.get(1) is None
+    assert cache.counters.expirations == 1
+    assert len(cache) == 0
+
+
+def test_disabled() -> None:
+    cache: LRUCache[int, str] = LRUCache(max_size=0, ttl=10)
+    cache.set(1, "a")
+    assert cache.get(1) is None
+
+
+def test_set_after_an_invalidation_is_dropped() -> None:
+    cache: LRUCache[int, str] = LRUCache(max_size=2, ttl=10)
+    epoch = cache.epoch
+    cache.invalidate(2)
+    cache.set(1, "a", epoch=epoch)
+    assert cache.get(1) is None
+    cache.set(1, "a", epoch=cache.epoch)
+    assert cache.get(1) == "a"
+
+
+def test_load_racing_an_invalidation_is_not_stored() -> None:
+    async def main() -> None:
+        cache: LRUCache[int, str] = LRUCache(max_size=2, ttl=10)
+        loading = asyncio.Event()
+        loaded = asyncio.Event()
+
+        async def load(key: int) -> str:
+            loading.set()
+            await loaded.wait()
+            return "old"
+
+        task = asyncio.create_task(cache.get_or_load(1, load))
+        await loading.wait()
+        # The row changes while it is read
+        cache.invalidate(1)
+        loaded.set()
+        assert await task == "old"
+        assert cache.get(1) is None
+
+        async def load_new(key: int) -> str:
+            return "new"
+
+        assert await cache.get_or_load(1, load_new) == "new"
+        assert cache.get(1) == "new"
+
+    asyncio.run(main())
+
+
+def test_missing_rows_are_not_cached() -> None:
+    async def main() -> None:
+        cache: LRUCache[int, str] = LRUCache(max_size=2, ttl=10)
+        calls = []
+
+        async def load(key: int) -> str | None:
+            calls.append(key)
+            return None
+
+        assert await cache.get_or_load(1, load) is None
+        assert await cache.get_or_load(1, load) is None
+        assert calls == [1, 1]
+
+    asyncio.run(main())
+
+
+def test_query_cache_is_cleared_on_write_and_after_the_refresh() -> None:
+    async def main() -> None:
+        cache = QueryResultCache(max_size=10, ttl=60, refresh_delay=0.05)
+        cache.set("q", "before")
+        cache.on_write()
+        assert cache.get("q") is None
+
+        # Searched before the refresh, without the write
+        cache.set("q", "stale")
+        await asyncio.sleep(0.1)
+        assert cache.get("q") is None
+
+        cache.set("q", "fresh")
+        await asyncio.sleep(0.1)
+        assert cache.get("q") == "fresh"
+
+    asyncio.run(main())
+
+
+def test_query_cache_waits_for_the_refresh_of_the_last_write() -> None:
+    async def main() -> None:
+        cache = QueryResultCache(max_size=10, ttl=60, refresh_delay=0.2)
+        cache.on_write()
+        await asyncio.sleep(0.12)
+        cache.on_write()
+        cache.set("q", "stale")
+        # The first write is refreshed, not the second one
+        await asyncio.sleep(0.12)
+        assert cache.get("q") == "stale"
+        await asyncio.sleep(0.2)
+        assert cache.get("q") is None
+
+    asyncio.run(main())
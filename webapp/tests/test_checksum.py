@@ -0,0 +1,16 @@
+from app.utils.checksum import row_hash, ROW_HASH_MODULUS
+
+
+def test_row_hash_range() -> None:
+    for id in (0, 1, ROW_HASH_MODULUS, 2**62):
+        for version in (0, 1, 2**20):
+            assert 0 <= row_hash(id, version) < ROW_HASH_MODULUS
+
+
+def test_opposite_version_drifts_do_not_cancel_out() -> None:
+    rows = dict.fromkeys(range(1, 200), 3)
+    expected = sum(row_hash(id, version) for id, version in rows.items())
+    for a in range(1, 50):
+        for b in range(a + 1, 50):
+            drifted = {**rows, a: rows[a] + 1, b: rows[b] - 1}
+            assert sum(row_hash(id, version) for id, version in drifted.items()) != expected
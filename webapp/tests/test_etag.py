@@ -0,0 +1,47 @@
+import pytest
+
+from app.utils.etag import etag_matches, etag_versions, make_etag, version_etag
+
+
+def test_version_etag() -> None:
+    assert version_etag(3) == '"3"'
+
+
+def test_make_etag_depends_on_every_part() -> None:
+    assert make_etag("postgres", [(1, 2)]) == make_etag("postgres", [(1, 2)])
+    assert make_etag("postgres", [(1, 2)]) != make_etag("postgres", [(1, 3)])
+    assert make_etag("postgres", [(1, 2)]) != make_etag("elasticsearch", [(1, 2)])
+
+
+@pytest.mark.parametrize(
+    "header, weak, expected",
+    [
+        (None, True, False),
+        ('"3"', True, True),
+        ('"2", "3"', True, True),
+        ('"2"', True, False),
+        ('W/"3"', True, True),
+        ('W/"3"', False, False),
+        ("*", True, True),
+        ("*", False, True),
+        ("", True, False),
+    ],
+)
+def test_etag_matches(header: str | None, weak: bool, expected: bool) -> None:
+    assert etag_matches(header, '"3"', weak=weak) is expected
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ('"3"', [3]),
+        ('"1", "2" ,"3"', [1, 2, 3]),
+        ("*", None),
+        ('"1", *', None),
+        ('W/"3"', []),
+        ('"abc", 3, "-1"', []),
+        ("", []),
+    ],
+)
+def test_etag_versions(header: str, expected: list[int] | None) -> None:
+    assert etag_versions(header) == expected
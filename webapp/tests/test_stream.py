@@ -0,0 +1,75 @@
+import asyncio
+import json
+from typing import Any, AsyncIterator
+
+import pytest
+
+from app.utils.stream import chunked, iter_json_records
+
+
+def decode(body: bytes, size: int) -> list[Any]:
+    async def chunks() -> AsyncIterator[bytes]:
+        for start in range(0, len(body), size):
+            yield body[start : start + size]
+
+    async def collect() -> list[Any]:
+        return [record async for record in iter_json_records(chunks())]
+
+    return asyncio.run(collect())
+
+
+CHUNK_SIZES = [1, 2, 3, 1024]
+
+ARRAYS = [
+    b"[]",
+    b"  [ ]  ",
+    b"[1e5]",
+    b"[1, 2.5, 3.5]",
+    b"[-0.5e-3, 12, true, false, null]",
+    b'[ {"a": [1, 2]} , "x,]" , {"b": {"c": "]"}} ]',
+    '[{"title": "café ☕"}]'.encode(),
+]
+
+
+@pytest.mark.parametrize("size", CHUNK_SIZES)
+@pytest.mark.parametrize("body", ARRAYS)
+def test_json_array(body: bytes, size: int) -> None:
+    assert decode(body, size) == json.loads(body)
+
+
+@pytest.mark.parametrize("size", CHUNK_SIZES)
+def test_ndjson(size: int) -> None:
+    body = b'{"a": 1}\n\n{"b": [1, 2]}\n3.5'
+    assert decode(body, size) == [{"a": 1}, {"b": [1, 2]}, 3.5]
+
+
+@pytest.mark.parametrize("size", CHUNK_SIZES)
+@pytest.mark.parametrize(
+    "body",
+    [
+        b"[1,,2]",
+        b"[,1]",
+        b"[1,]",
+        b"[1 2]",
+        b'[{"a": 1} {"b": 2}]',
+        b"[tru]",
+        b"[1.]",
+        b"[01]",
+        b"[1",
+        b"[1] 2",
+    ],
+)
+def test_invalid_json_array(body: bytes, size: int) -> None:
+    with pytest.raises(ValueError):
+        decode(body, size)
+
+
+def test_chunked() -> None:
+    async def items() -> AsyncIterator[int]:
+        for item in range(5):
+            yield item
+
+    async def collect() -> list[list[int]]:
+        return [chunk async for chunk in chunked(items(), 2)]
+
+    assert asyncio.run(collect()) == [[0, 1], [2, 3], [4]]